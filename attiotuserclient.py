@@ -11,13 +11,24 @@ import json
 import httplib                                 # for http comm
 import urllib                                   # for http params
 import time
+import threading
+import Queue
+import collections
+import os
+import functools
+import weakref
+import types
+from workers import WorkerPool
 from socket import error as SocketError         # for http error handling
 import errno
 
 _mqttClient = None
 _mqttConnected = False
-_httpClient = None
-_callbacks = {}
+_httpPool = None
+_callbacks = {}                                         # topic -> list of SubscriberData. Also used to route the messages that arrive on the wildcard subscription.
+_callbacksLock = threading.RLock()                      # _callbacks is used from the ui thread, the mqtt network thread and worker threads.
+_wildcardSubscribed = False                             # true when the broker subscription for the state of all assets is active.
+_wildcardThreshold = 50                                 # when more asset states than this are monitored, they are all received through 1 wildcard subscription instead of 1 subscription per asset.
 _get_assets_callback = None
 
 _curHttpServer = None
@@ -28,6 +39,12 @@ _clientId = None
 _brokerUser = None
 _brokerPwd = None
 _isLoggedIn = False                                     # keeps track if user is logged in or not, so we can show the correct errors.
+_stateRefresher = WorkerPool(4, 'state-refresh')        # fetches the state of the monitored assets after a reconnect, max 4 at the same time.
+_commandTransport = 'mqtt'                              # 'mqtt': publish commands over the broker connection when it is up, otherwise http. 'http': always use http
+_publishTimeout = 5                                     # nr of seconds to wait for the broker to confirm a command, otherwise it's sent over http.
+_publishLock = threading.Lock()
+_publishWaiters = {}                                    # mid -> threading.Event, for the commands that are waiting for their PUBACK
+_earlyAcks = {}                                         # mid -> time, PUBACKs that arrived before the sender started waiting for them.
 
 class AssetNotFoundException(Exception):
     def __init__(self, arg):
@@ -35,58 +52,367 @@ class AssetNotFoundException(Exception):
         self.msg = arg
 
 
-class SubscriberData:
+class HttpConnectionPool:
     """
-    callback: function to call when data arrived.
+    a small pool of keep-alive http connections to a single server.
+    Connections are handed out to 1 thread at a time, so the mqtt network thread and the ui thread can
+    do requests at the same time without mixing up each other's responses.
+    """
+    def __init__(self, server, maxSize = 4):
+        self.server = server
+        self.maxSize = maxSize
+        self._idle = Queue.LifoQueue()                          # most recently used first, so we reuse the connection that is most likely still open.
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+
+    def acquire(self):
+        """get a connection for exclusive use. Blocks when all connections are in use.
+        Always return the connection with 'release' or 'discard'."""
+        with self._lock:
+            if self._closed:
+                raise Exception("http connection pool is closed")
+            if self._idle.empty() and self._created < self.maxSize:
+                self._created += 1
+                return httplib.HTTPConnection(self.server)
+        result = self._idle.get()
+        if result is None:                                      # the pool got closed while we were waiting
+            self._idle.put(None)                                # wake up the next waiting thread as well
+            raise Exception("http connection pool is closed")
+        return result
+
+    def release(self, connection):
+        """return a healthy connection to the pool so it can be reused by the next request"""
+        with self._lock:
+            if self._closed:
+                connection.close()
+                return
+        self._idle.put(connection)
+
+    def discard(self, connection):
+        """close a connection that produced an error. Only the failing connection is closed, other threads can
+        continue with theirs. httplib reopens a closed connection on the next request, so the object goes back in the pool."""
+        try:
+            connection.close()
+        except:
+            logging.exception("failed to close http connection")
+        self.release(connection)
+
+    def close(self):
+        """close all the idle connections. Connections that are still in use get closed when they are returned.
+        Threads that are waiting for a connection get an exception."""
+        with self._lock:
+            self._closed = True
+        while not self._idle.empty():
+            connection = self._idle.get()
+            if connection:
+                connection.close()
+        self._idle.put(None)                                    # release returns nothing to the queue anymore, so this stays the only item.
+
+
+class MetadataCache:
+    """
+    keeps the definitions of assets, devices and gateways that were retrieved from the platform, so we don't have to
+    fetch them again each time they are needed. Items expire after 'ttl' seconds, when there are more than
+    'maxSize' items, the least recently used ones are removed. The content can be stored on disk so that it survives
+    restarts of the app.
+    """
+    def __init__(self, ttl = 24 * 3600, maxSize = 1000):
+        self.ttl = ttl
+        self.maxSize = maxSize
+        self.fileName = None
+        self._items = collections.OrderedDict()                 # key -> (time stored, value), last item = most recently used
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """returns the value stored under key or None if it is not known or expired"""
+        with self._lock:
+            if key in self._items:
+                stored, value = self._items.pop(key)
+                if stored + self.ttl > time.time():
+                    self._items[key] = (stored, value)          # move to the back: most recently used
+                    return value
+
+    def put(self, key, value):
+        with self._lock:
+            if key in self._items:
+                self._items.pop(key)
+            self._items[key] = (time.time(), value)
+            while len(self._items) > self.maxSize:
+                self._items.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def updateState(self, assetId, state):
+        """keep the state of a cached asset up to date, so that a warm start shows the last known value.
+        doesn't change the age of the item."""
+        with self._lock:
+            key = 'asset/' + assetId
+            if key in self._items:
+                self._items[key][1]['state'] = state
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def load(self, fileName):
+        """load the cache content from disk. The file will also be used to save the content to."""
+        self.fileName = fileName
+        self.clear()
+        if os.path.isfile(fileName):
+            try:
+                with open(fileName) as f:
+                    data = json.load(f)
+                now = time.time()
+                with self._lock:
+                    for key, stored, value in data['items']:
+                        if stored + self.ttl > now:
+                            self._items[key] = (stored, value)
+            except:
+                logging.exception("failed to load metadata cache, starting with an empty one")
+
+    def save(self):
+        """store the cache content on disk, in the file that was last loaded"""
+        if self.fileName:
+            with self._lock:
+                items = [[key, stored, value] for key, (stored, value) in self._items.iteritems()]
+            with open(self.fileName, 'w') as f:
+                json.dump({'version': 1.0, 'items': items}, f)
+
+_metadataCache = MetadataCache()                                # asset, device and gateway definitions.
+
+class CommandSender:
+    """
+    sends actuator commands on a background thread, so the ui never waits for the network.
+    Per asset, only the newest value that is still waiting to be sent is kept: when a slider is dragged, the
+    intermediate values that couldn't be sent in time are dropped. Failed sends are retried with an increasing delay.
+    """
+    def __init__(self, retries = 5, backoff = 0.2):
+        self.retries = retries
+        self.backoff = backoff                                          # delay before the first retry, doubles after each failure.
+        self._pending = collections.OrderedDict()                       # asset id -> (value, callback), in order of arrival
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def send(self, id, value, callback = None):
+        """
+        queue the value for sending. If there was still a value waiting for the same asset, it is replaced.
+        :param callback: function(id, value, error), called on the sender thread when done. error is None if all went well.
+        """
+        with self._condition:
+            self._pending.pop(id, None)
+            self._pending[id] = (value, callback)
+            self._condition.notify()
+            if not self._thread:
+                self._thread = threading.Thread(target=self._run, name='command-sender')
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                id, (value, callback) = self._pending.popitem(last=False)
+            error = self._sendWithRetry(id, value)
+            if callback:
+                try:
+                    callback(id, value, error)
+                except:
+                    logging.exception("command callback failed")
+
+    def _sendWithRetry(self, id, value):
+        delay = self.backoff
+        retryCount = 0
+        while True:
+            try:
+                send(id, value)
+                return None
+            except AssetNotFoundException as e:                         # the platform refused the command, sending it again won't help.
+                return e
+            except Exception as e:
+                retryCount += 1
+                if retryCount >= self.retries:
+                    logging.exception("failed to send command")
+                    return e
+                logging.info("failed to send command, retrying in " + str(delay) + " sec")
+                time.sleep(delay)
+                delay *= 2
+                with self._condition:
+                    if id in self._pending:                             # a newer value arrived while we were waiting, don't bother with this one anymore.
+                        return None
+
+
+class TokenRefresher:
+    """
+    renews the access token on a background thread shortly before it expires, so that a request never has to
+    wait for a login round trip. Requests only wait when a refresh is already running.
+    """
+    def __init__(self, margin = 60, retryDelay = 30):
+        self.margin = margin                                            # nr of seconds before the token expires that it gets renewed.
+        self.retryDelay = retryDelay                                    # nr of seconds to wait before trying again when the refresh failed (no network)
+        self._timer = None
+        self._lock = threading.Lock()
+        self._idle = threading.Event()                                  # set while no refresh is running
+        self._idle.set()
+
+    def schedule(self, expiresAt):
+        """plan the next refresh, some time before 'expiresAt' (epoch time). Replaces any previous plan."""
+        self._start(expiresAt - self.margin - time.time())
+
+    def cancel(self):
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            self._idle.set()                                            # don't let requests wait for a refresh that will never come.
+
+    def isRefreshing(self):
+        return not self._idle.is_set()
+
+    def wait(self, timeout = 30):
+        """block until the running refresh is done"""
+        self._idle.wait(timeout)
+
+    def refreshNow(self):
+        """start a refresh in the background, unless one is already running"""
+        self._start(0)
+
+    def _start(self, delay):
+        with self._lock:
+            if delay <= 0 and not self._idle.is_set():                  # already running, the caller can wait for that one.
+                return
+            if self._timer:
+                self._timer.cancel()
+            self._timer = threading.Timer(max(delay, 0), self._refresh)
+            self._timer.daemon = True
+            if delay <= 0:
+                self._idle.clear()                                      # requests that come in from now on have to wait for the new token.
+            self._timer.start()
+
+    def _refresh(self):
+        with self._lock:
+            self._timer = None
+            self._idle.clear()
+        try:
+            refreshToken()                                              # schedules the next refresh when it got a new token
+        except:
+            logging.exception("failed to refresh the access token, trying again later")
+            if _refresh_token:
+                self._start(self.retryDelay)
+        finally:
+            self._idle.set()
+
+_tokenRefresher = TokenRefresher()
+
+
+class SubscriberData(object):
+    """
+    callback: function to call when data arrived. For bound methods, only a weak reference to the object is kept, so
+              that a subscription doesn't keep a control alive: when the object is gone, the subscription is removed.
     direction: 'in' (from cloud to client) or 'out' (from device to cloud)
     toMonitor: 'state': changes in the value of the asset, 'command' actuator commands, 'events': device/asset/... creaated, deleted,..
     level: 'asset', 'device', 'gateway', 'ground' # 'all device-assets', 'all gateway-assets', 'all gateway-devices', 'all gateway-device-assets'
+    refCount: the nr of times that the same callback subscribed to the same topic. The subscription is removed when it drops to 0.
     """
     def __init__(self):
         self.id = None
-        self.callback = None
+        self._callback = None
         self.direction = 'in'
         self.toMonitor = 'state'
         self.level = 'asset'
+        self.refCount = 0
+
+    @property
+    def callback(self):
+        """the function to call, None when the object that it belonged to was garbage collected."""
+        if self._callback:
+            return self._callback()
+
+    @callback.setter
+    def callback(self, value):
+        if value is None:
+            self._callback = None
+        elif getattr(value, 'im_self', None) is not None:          # bound method: don't keep the object alive
+            obj = weakref.ref(value.im_self)
+            func = value.im_func
+            def resolve():
+                target = obj()
+                if target is not None:
+                    return types.MethodType(func, target)
+            self._callback = resolve
+        else:
+            self._callback = lambda: value
+
+    def isAlive(self):
+        return self.callback is not None
 
 # The callback for when the client receives a CONNACK response from the server.
 def on_connect(client, userdata, rc):
-    global _mqttConnected
+    global _mqttConnected, _wildcardSubscribed
     try:
         if rc == 0:
             _mqttConnected = True
+            _wildcardSubscribed = False                         # new session, the broker forgot all previous subscriptions.
             logging.info("Connected to mqtt broker with result code "+str(rc))
-            if _callbacks:
-                for topic, definitions in _callbacks.iteritems():
-                    _subscribe(topic)
-                    for definition in definitions:
-                        if definition.level == 'asset' and definition.direction == 'in' and definition.toMonitor == 'state':    # refresh the state of all assets being monitored when reconnecting. Other events can't be refreshed.
-                            curVal = getAssetState(definition.id)
-                            if curVal:
-                                if 'state' in curVal:
-                                    definition.callback(curVal['state'])
-                                elif 'value' in curVal:
-                                    definition.callback(curVal)
+            with _callbacksLock:
+                _brokerSubscribeAll()
+            refreshStates()                                     # refresh the state of all assets being monitored when reconnecting. Other events can't be refreshed.
         else:
             logging.error("Failed to connect to mqtt broker: " + mqtt.connack_string(rc))
     except Exception:
         logging.exception("failed to connect")
 
 
+def refreshStates(assetIds = None):
+    """fetch the current state of all the monitored assets and deliver it to their callbacks.
+    Doesn't block: the requests are done in the background, a few at a time.
+    :param assetIds: when specified, only the monitored assets in this list are refreshed."""
+    toRefresh = {}                                      # topic -> asset id, so that an asset that is monitored multiple times is only fetched once.
+    with _callbacksLock:
+        topics = _callbacks.keys()
+    for topic in topics:
+        for definition in _getLiveSubscribers(topic):
+            if definition.level == 'asset' and definition.direction == 'in' and definition.toMonitor == 'state':
+                if assetIds is None or definition.id in assetIds:
+                    toRefresh[topic] = definition.id
+    for topic, id in toRefresh.iteritems():
+        _stateRefresher.submit(getAssetState, (id,), functools.partial(_stateRefreshed, topic))
+
+def _stateRefreshed(topic, curVal):
+    """called on a worker thread when the state of an asset was fetched after a reconnect"""
+    if curVal:
+        if 'state' in curVal:
+            value = curVal['state']
+        elif 'value' in curVal:
+            value = curVal
+        else:
+            return
+        for definition in _getLiveSubscribers(topic):
+            if definition.level == 'asset' and definition.direction == 'in' and definition.toMonitor == 'state':
+                callback = definition.callback
+                if callback:
+                    callback(value)
+
+
 # The callback for when a PUBLISH message is received from the server.
 def on_MQTTmessage(client, userdata, msg):
     global _lastMessage
     try:
-        if msg.topic in _callbacks:
-            topicParts = msg.topic.split('/')
-            logging.info(str(topicParts))
-            if topicParts[2] == 'in':                   # data from cloud to client is always json, from device to cloud is not garanteed to be json.
-                value = json.loads(msg.payload)
-            else:
-                value = msg.payload
-            defs = _callbacks[msg.topic]
-            for definition in defs:
-                definition.callback(value)
+        topicParts = msg.topic.split('/')
+        logging.info(str(topicParts))
+        if topicParts[2] == 'in':                   # data from cloud to client is always json, from device to cloud is not garanteed to be json.
+            value = json.loads(msg.payload)
+        else:
+            value = msg.payload
+        if _isAssetStateTopic(msg.topic):
+            _metadataCache.updateState(topicParts[4], value)        # with the wildcard, this also gets the assets that aren't monitored at the moment
+        for definition in _getLiveSubscribers(msg.topic):
+            callback = definition.callback
+            if callback:
+                callback(value)
     except Exception as e:
         if msg.payload:
             logging.exception("failed to process incomming message" + str(msg.payload))
@@ -96,6 +422,29 @@ def on_MQTTmessage(client, userdata, msg):
 def on_MQTTSubscribed(client, userdata, mid, granted_qos):
     logging.info("Subscribed to topic, receiving data from the cloud: qos=" + str(granted_qos))
 
+def on_MQTTPublished(client, userdata, mid):
+    """called on the mqtt network thread when the broker confirmed a command"""
+    with _publishLock:
+        event = _publishWaiters.get(mid)
+        if event:
+            event.set()
+        else:
+            _earlyAcks[mid] = time.time()
+
+def _waitForAck(mid, sentAt):
+    """wait until the broker confirmed the message. returns False if that didn't happen in time.
+    :param sentAt: the time right before the message was published, older acks are for a previous message with the same mid."""
+    event = threading.Event()
+    with _publishLock:
+        if _earlyAcks.pop(mid, 0) >= sentAt:
+            return True
+        _publishWaiters[mid] = event
+    try:
+        return event.wait(_publishTimeout)
+    finally:
+        with _publishLock:
+            _publishWaiters.pop(mid, None)
+
 def connect(username, pwd, httpServer="api.smartliving.io", mqttServer="broker.smartliving.io"):
     '''start the mqtt client and make certain that it can receive data from the IOT platform
 	   mqttServer: (optional): the address of the mqtt server. Only supply this value if you want to a none standard server.
@@ -112,9 +461,13 @@ def connect(username, pwd, httpServer="api.smartliving.io", mqttServer="broker.s
     _subscribe_mqtt(mqttServer)
 
 def reconnect(httpServer, mqttServer):
-    global _httpClient, _curHttpServer
-    _httpClient = httplib.HTTPConnection(httpServer)
+    global _httpPool, _curHttpServer
+    if _httpPool:
+        _httpPool.close()
+    _httpPool = HttpConnectionPool(httpServer)
     _curHttpServer = httpServer             #so we can reconnect if needed
+    if _expires_in:
+        _tokenRefresher.schedule(_expires_in)   # timers were stopped while disconnected, if the token expired in the mean time, it is renewed right away.
     _subscribe_mqtt(mqttServer)             #subscrriptions will be made after the connection is established
 
 def disconnect(resumable = False):
@@ -122,24 +475,38 @@ def disconnect(resumable = False):
     if resumable is True, then only the network connections get closed, but the connection data remains, so that
     you can restart connections using the reconnect features.
     """
-    global  _access_token, _refresh_token, _expires_in, _mqttClient, _httpClient, _mqttConnected, _callbacks, _brokerPwd, _brokerUser, _isLoggedIn
+    _tokenRefresher.cancel()
+    global  _access_token, _refresh_token, _expires_in, _mqttClient, _httpPool, _mqttConnected, _callbacks, _brokerPwd, _brokerUser, _isLoggedIn, _wildcardSubscribed
     if not resumable:
         _isLoggedIn = False
         _access_token = None
         _refresh_token = None
         _expires_in = None
-        for topic, callback in _callbacks.iteritems():
-            _unsubscribe(topic)
-        _callbacks = {}
+        with _callbacksLock:
+            topics = _callbacks.keys()
+            _callbacks = {}
+            if _mqttClient and _mqttConnected == True:
+                for topic in topics:
+                    _brokerUnsubscribe(topic)
         _brokerPwd = None
         _brokerUser = None
     if _mqttClient:
         _mqttClient.disconnect()
         _mqttClient = None
     _mqttConnected = False
-    if _httpClient:
-        _httpClient.close()
-    _httpClient = None
+    _wildcardSubscribed = False
+    if _httpPool:
+        _httpPool.close()
+    _httpPool = None
+    try:
+        _metadataCache.save()
+    except:
+        logging.exception("failed to save metadata cache")
+
+def setCacheFile(fileName):
+    """load the cached asset/device/gateway definitions from the specified file. When the connection is closed, the
+    cache is saved to the same file."""
+    _metadataCache.load(fileName)
 
 def subscribe(asset, callback):
     """monitor for changes for that asset. For more monitor features, use 'subscribeAdv'
@@ -151,43 +518,79 @@ def subscribe(asset, callback):
     data = SubscriberData()
     data.id = asset
     data.callback = callback
-    topic = _getTopic(data)
-    if topic in _callbacks:
-        _callbacks[topic].append(data)
-    else:
-        _callbacks[topic] = [data]
-    if _mqttClient and _mqttConnected == True:
-        _subscribe(topic)
+    subscribeAdv(data)
 
 def subscribeAdv(subscriberData):
-    """subscribe to topics with advanced parameter options"""
+    """subscribe to topics with advanced parameter options.
+    When the same callback is subscribed to the same topic multiple times, only the reference count goes up."""
     topic = _getTopic(subscriberData)
-    if topic in _callbacks:
-        _callbacks[topic].append(subscriberData)
-    else:
-        _callbacks[topic] = [subscriberData]
-    if _mqttClient and _mqttConnected == True:
-        _subscribe(topic)
+    with _callbacksLock:
+        if topic in _callbacks:
+            existing = _findSubscriber(_callbacks[topic], subscriberData.callback)
+            if existing:
+                existing.refCount += 1
+            else:
+                subscriberData.refCount = 1
+                _callbacks[topic].append(subscriberData)
+        else:
+            subscriberData.refCount = 1
+            _callbacks[topic] = [subscriberData]
+            if _mqttClient and _mqttConnected == True:
+                _brokerSubscribe(topic)
 
-def unsubscribe(id, level = 'asset'):
+def unsubscribe(id, level = 'asset', callback = None):
     """
-    remove all the callbacks for the specified id.
+    remove the callbacks for the specified id. When the last callback of a topic is removed, the broker subscription
+    is removed as well.
     :param level: which type of item: asset, device, gateway
     :param id: the id of the item (asset, device, gateway,..) to remove
+    :param callback: when specified, only 1 reference of this callback is removed, otherwise all the callbacks are removed.
     """
     desc = SubscriberData()
     desc.id = id
     desc.level = level
-    for direction in ['in', 'out']:
-        desc.direction = direction
-        for toMonitor in ['state', 'event', 'command']:
-            desc.toMonitor = toMonitor
-            topic = _getTopic(desc)
-            if topic in _callbacks:
-                _callbacks.pop(topic)
-                if _mqttClient and _mqttConnected == True:
-                    _unsubscribe(topic)
-
+    with _callbacksLock:
+        for direction in ['in', 'out']:
+            desc.direction = direction
+            for toMonitor in ['state', 'event', 'command']:
+                desc.toMonitor = toMonitor
+                topic = _getTopic(desc)
+                if topic in _callbacks:
+                    if callback:
+                        existing = _findSubscriber(_callbacks[topic], callback)
+                        if existing:
+                            existing.refCount -= 1
+                            if existing.refCount <= 0:
+                                _callbacks[topic].remove(existing)
+                        if _callbacks[topic]:
+                            continue
+                    _removeTopic(topic)
+
+def _findSubscriber(definitions, callback):
+    for definition in definitions:
+        if definition.callback == callback:
+            return definition
+
+def _removeTopic(topic):
+    """remove the topic from the router and the broker. call while holding _callbacksLock"""
+    _callbacks.pop(topic)
+    if _mqttClient and _mqttConnected == True:
+        _brokerUnsubscribe(topic)
+
+def _getLiveSubscribers(topic):
+    """get a copy of the subscribers of the topic, without the ones whose object was garbage collected.
+    The dead ones are removed, so the router doesn't keep growing."""
+    with _callbacksLock:
+        definitions = _callbacks.get(topic)
+        if not definitions:
+            return []
+        live = [x for x in definitions if x.isAlive()]
+        if len(live) != len(definitions):
+            if live:
+                _callbacks[topic] = live
+            else:
+                _removeTopic(topic)
+        return list(live)
 
 def getOutPath(assetId):
     """converts the asset id to a path of gateway id /device name / asset name or device id / asset name"""
@@ -228,12 +631,78 @@ def _getTopic(desc):
     #todo: add topic renderers for different type of topics.
     raise NotImplementedError()
 
+def _getWildcardTopic():
+    """the topic that delivers the state changes of all the assets of the client"""
+    return str("client/" + _clientId + "/in/asset/+/state")
+
+def _isAssetStateTopic(topic):
+    """true if the topic delivers the state of an asset (client/<id>/in/asset/<asset>/state), these can be received through the wildcard"""
+    parts = topic.split('/')
+    return len(parts) == 6 and parts[2] == 'in' and parts[3] == 'asset' and parts[5] == 'state'
+
+def _getAssetStateTopics():
+    """the asset state topics that are monitored. call while holding _callbacksLock"""
+    return [topic for topic in _callbacks if _isAssetStateTopic(topic)]
+
+# Asset states are subscribed per topic, so that the broker only sends the values of the assets that are shown.
+# When a lot of them are monitored, that costs a lot of (un)subscribe packets when switching groups, so above
+# _wildcardThreshold, 1 wildcard subscription delivers the state of all the assets of the client and the messages
+# are routed locally with _callbacks. We only go back to separate subscriptions when less than half of the
+# threshold remains, so a count that hovers around the threshold doesn't keep on switching.
+
+def _brokerSubscribeAll():
+    """subscribe to all the monitored topics, after (re)connecting. call while holding _callbacksLock"""
+    global _wildcardSubscribed
+    stateTopics = _getAssetStateTopics()
+    topics = [topic for topic in _callbacks if topic not in stateTopics]
+    if len(stateTopics) > _wildcardThreshold:
+        _wildcardSubscribed = True
+        topics.append(_getWildcardTopic())
+    else:
+        topics.extend(stateTopics)
+    if topics:
+        _subscribe(topics)
+
+def _brokerSubscribe(topic):
+    """make certain that the broker delivers the messages of the topic. call while holding _callbacksLock, after
+    the topic was added to _callbacks."""
+    global _wildcardSubscribed
+    if _isAssetStateTopic(topic):
+        if _wildcardSubscribed:
+            return
+        stateTopics = _getAssetStateTopics()
+        if len(stateTopics) > _wildcardThreshold:
+            _wildcardSubscribed = True
+            _subscribe(_getWildcardTopic())                                 # first the wildcard, so no values get lost while switching
+            for x in stateTopics:
+                if x != topic:
+                    _unsubscribe(x)
+            return
+    _subscribe(topic)
+
+def _brokerUnsubscribe(topic):
+    """the counterpart of _brokerSubscribe. call while holding _callbacksLock, after the topic was removed from _callbacks."""
+    global _wildcardSubscribed
+    if _isAssetStateTopic(topic) and _wildcardSubscribed:
+        stateTopics = _getAssetStateTopics()
+        if len(stateTopics) < _wildcardThreshold / 2:
+            if stateTopics:
+                _subscribe(stateTopics)
+            _wildcardSubscribed = False
+            _unsubscribe(_getWildcardTopic())
+    else:
+        _unsubscribe(topic)
+
 def _subscribe(topic):
     """
         internal subscribe routine
-    :param desc: description of the subscription to make
+    :param topic: the topic to subscribe to, or a list of topics, which are sent in a single packet.
     """
-    logging.info("subscribing to: " + topic)
+    if isinstance(topic, list):
+        logging.info("subscribing to {} topics".format(len(topic)))
+        topic = [(x, 0) for x in topic]
+    else:
+        logging.info("subscribing to: " + topic)
     result = _mqttClient.subscribe(topic)                                                    #Subscribing in on_connect() means that if we lose the connection and reconnect then subscriptions will be renewed.
     logging.info(str(result))
 
@@ -251,6 +720,7 @@ def _subscribe_mqtt(broker):
         _mqttClient.on_connect = on_connect
         _mqttClient.on_message = on_MQTTmessage
         _mqttClient.on_subscribe = on_MQTTSubscribed
+        _mqttClient.on_publish = on_MQTTPublished
         _mqttClient.username_pw_set(_brokerUser, _brokerPwd)
 
         _mqttClient.connect(broker, 1883, 60)
@@ -265,16 +735,20 @@ def extractHttpCredentials(data):
         _refresh_token = data['refresh_token']
         _expires_in = time.time() + data['expires_in']
         _clientId = data['rmq:clientId']
+        _tokenRefresher.schedule(_expires_in)
     else:
+        _tokenRefresher.cancel()
         _access_token = None
         _refresh_token = None
         _expires_in = None
         _clientId = None
 
 def connectHttp(username, pwd, httpServer):
-    global _httpClient, _curHttpServer
+    global _httpPool, _curHttpServer
     _curHttpServer = httpServer
-    _httpClient = httplib.HTTPConnection(httpServer)
+    if _httpPool:
+        _httpPool.close()
+    _httpPool = HttpConnectionPool(httpServer)
     loginRes = login(username, pwd)
     extractHttpCredentials(loginRes)
     return loginRes
@@ -285,17 +759,17 @@ def login(username, pwd):
     body = "grant_type=password&username=" + username + "&password=" + pwd + "&client_id=maker"
     print("HTTP POST: " + url)
     print("HTTP BODY: " + body)
-    _httpClient.request("POST", url, body, {"Content-type": "application/json"})
-    response = _httpClient.getresponse()
-    logging.info(str((response.status, response.reason)))
-    jsonStr =  response.read()
-    logging.info(jsonStr)
+    response, jsonStr = _sendHttp("POST", url, body, {"Content-type": "application/json"})
     if response.status == 200:
         _isLoggedIn = True
         return json.loads(jsonStr)
     else:
         _processError(jsonStr)
 
+def isLoggedIn():
+    """true when the account was accepted by the cloud, so that reconnect can be used instead of connect"""
+    return _isLoggedIn and _brokerUser is not None
+
 def _processError(str):
     obj = json.loads(str)
     if obj:
@@ -306,37 +780,48 @@ def _processError(str):
     raise AssetNotFoundException(str)
 
 def refreshToken():
-    """no need for error handling, is called within doHTTPRequest, which does the error handling"""
+    """get a new access token. Is called by the TokenRefresher on a background thread, which does the error handling"""
     global _access_token, _refresh_token
     url = "/login"
     body = "grant_type=refresh_token&refresh_token=" + _refresh_token + "&client_id=maker"
     print("HTTP POST: " + url)
     print("HTTP BODY: " + body)
-    _httpClient.request("POST", url, body, {"Content-type": "application/json"})
-    response = _httpClient.getresponse()
-    logging.info(str((response.status, response.reason)))
-    jsonStr =  response.read()
-    logging.info(jsonStr)
+    response, jsonStr = _sendHttp("POST", url, body, {"Content-type": "application/json"})
     if response.status == 200:
         loginRes = json.loads(jsonStr)
     else:
         loginRes = None
     extractHttpCredentials(loginRes)
 
-def getAsset(id):
+def _getCached(key, url, useCache):
+    """get a definition from the cache, if it's not there (or no cache should be used), get it from the platform."""
+    if useCache:
+        result = _metadataCache.get(key)
+        if result:
+            return result
+    result = doHTTPRequest(url, "")
+    if result:
+        _metadataCache.put(key, result)
+    return result
+
+def getAsset(id, useCache = True):
     """get the details for the specified asset"""
-    url = "/asset/" + id
-    return doHTTPRequest(url, "")
+    return _getCached("asset/" + id, "/asset/" + id, useCache)
 
 def getAssetState(id):
     """get the details for the specified asset"""
     url = "/asset/" + id + '/state'
-    return doHTTPRequest(url, "")
+    result = doHTTPRequest(url, "")
+    if result:
+        if 'state' in result:
+            _metadataCache.updateState(id, result['state'])
+        elif 'value' in result:
+            _metadataCache.updateState(id, result)
+    return result
 
-def getGateway(id):
+def getGateway(id, useCache = True):
     """get the details for the specified gateway"""
-    url = "/gateway/" + id
-    return doHTTPRequest(url, "")
+    return _getCached("gateway/" + id, "/gateway/" + id, useCache)
 
 def getGrounds(includeShared):
     """get all the grounds related to the current account.
@@ -357,10 +842,9 @@ def getDevices(ground):
     if result:
         return result['items']
 
-def getDevice(deviceId):
-    """get all the devices related to a ground"""
-    url = "/device/" + deviceId
-    return doHTTPRequest(url, "")
+def getDevice(deviceId, useCache = True):
+    """get the details for the specified device"""
+    return _getCached("device/" + deviceId, "/device/" + deviceId, useCache)
 
 def getAssets(device):
     """"get all the assets for a device"""
@@ -369,13 +853,29 @@ def getAssets(device):
     if result:
         return result['assets']
 
-def _reconnectAfterSendData():
+def _sendHttp(method, url, content, headers):
+    """send a single request over a connection from the pool and read the full response.
+    The connection is only returned to the pool after the response was read completely, so that no other thread
+    can send a request on it while we are still waiting. If something went wrong, the connection is discarded
+    (only that one, others remain open)."""
+    pool = _httpPool                         # reconnect can replace the pool while we are busy, the connection has to go back to the one it came from.
+    if not pool:
+        raise Exception("not connected")
+    connection = pool.acquire()
     try:
-        global _httpClient
-        _httpClient.close()
-        _httpClient = httplib.HTTPConnection(_curHttpServer)  # recreate the connection when something went wrong. if we don't do this and an error occured, consecutive requests will also fail.
+        connection.request(method, url, content, headers)
+        response = connection.getresponse()
+        logging.info(str((response.status, response.reason)))
+        jsonStr = response.read()
+        logging.info(jsonStr)
     except:
-        logging.exception("reconnect failed after _sendData produced an error")
+        pool.discard(connection)             # recreate the connection when something went wrong. if we don't do this and an error occured, consecutive requests will also fail.
+        raise
+    if response.will_close:
+        pool.discard(connection)             # server doesn't keep this one alive, don't hand it out again.
+    else:
+        pool.release(connection)
+    return response, jsonStr
 
 def doHTTPRequest(url, content, method = "GET"):
     """send the data and check the result
@@ -383,50 +883,74 @@ def doHTTPRequest(url, content, method = "GET"):
         we try again
     """
     if _isLoggedIn:
-        success = False
         badStatusLineCount = 0                              # keep track of the amount of 'badStatusLine' exceptions we received. If too many raise to caller, otherwise retry.
-        while not success:
+        while True:
             try:
-                if _expires_in < time.time():               #need to refesh the token first
-                    refreshToken()
+                if not _tokenRefresher.isRefreshing() and _expires_in < time.time():      # the refresher missed it's moment (device was sleeping): let it start now
+                    _tokenRefresher.refreshNow()
+                if _tokenRefresher.isRefreshing():                                          # don't use a token that is being replaced
+                    _tokenRefresher.wait()
                 headers = {"Content-type": "application/json", "Authorization": "Bearer " + _access_token}
                 print("HTTP " + method + ': ' + url)
                 print("HTTP HEADER: " + str(headers))
                 print("HTTP BODY: " + content)
-                _httpClient.request(method, url, content, headers)
-                response = _httpClient.getresponse()
-                logging.info(str((response.status, response.reason)))
-                jsonStr =  response.read()
-                logging.info(jsonStr)
+                response, jsonStr = _sendHttp(method, url, content, headers)
                 if response.status == 200:
                     if jsonStr: return json.loads(jsonStr)
                     else: return                                                    # get out of the ethernal loop
-                elif not response.status == 200:
+                else:
                     _processError(jsonStr)
             except httplib.BadStatusLine:                   # a bad status line is probably due to the connection being closed. If it persists, raise the exception.
-                badStatusLineCount =+ 1
+                badStatusLineCount += 1
                 if badStatusLineCount < 10:
-                    logging.info("reconnecting after badstatusLine")
-                    _reconnectAfterSendData()
+                    logging.info("retrying after badstatusLine")
                 else:
                     raise
             except SocketError as e:
-                logging.info("reconnecting after socket error")
-                _reconnectAfterSendData()
-                if e.errno != errno.ECONNRESET:             # if it's error 104 (connection reset), then we try to resend it, cause we just reconnected
-                    raise e[0], e[1], e[2]
-            except:
-                logging.info("reconnecting after generic exception")
-                _reconnectAfterSendData()
-                raise
+                logging.info("socket error, connection was reset")
+                if e.errno != errno.ECONNRESET:             # if it's error 104 (connection reset), then we try to resend it, the pool already replaced the connection
+                    raise
     else:
         raise Exception("Not logged in: please check your credentials")
 
+_commandSender = CommandSender()
+
+def sendAsync(id, value, callback = None):
+    """send the value to the actuator in the background. Only the newest value per asset is sent when
+    the previous one is still waiting.
+    :param callback: function(id, value, error), called from the sender thread when done. error is None when succesful.
+    """
+    _commandSender.send(id, value, callback)
+
+def setCommandTransport(transport):
+    """select how actuator commands are sent.
+    :param transport: 'mqtt': publish over the broker connection when it is available, fall back to http otherwise. 'http': always use a http request.
+    """
+    global _commandTransport
+    if transport not in ['mqtt', 'http']:
+        raise Exception("unknown command transport: " + str(transport))
+    _commandTransport = transport
+
 def send(id, value):
-    typeOfVal = type(value)
     body = {"value": value }
     body = json.dumps(body)
 
+    if _commandTransport == 'mqtt' and _mqttClient and _mqttConnected == True:
+        desc = SubscriberData()
+        desc.id = id
+        desc.direction = 'out'
+        desc.toMonitor = 'command'
+        topic = _getTopic(desc)
+        logging.info("MQTT PUBLISH: " + topic + ", " + body)
+        sentAt = time.time()
+        result, mid = _mqttClient.publish(topic, body, qos=1)              # qos 0 only tells us that the message was queued locally
+        if result == mqtt.MQTT_ERR_SUCCESS:
+            if _waitForAck(mid, sentAt):
+                return
+            logging.info("broker didn't confirm the command in time, sending over http")
+        else:
+            logging.info("failed to publish command (" + mqtt.error_string(result) + "), sending over http")
+
     url = "/asset/" +  id + "/command"
 
-    result = doHTTPRequest(url, body, "PUT")
\ No newline at end of file
+    result = doHTTPRequest(url, body, "PUT")
@@ -0,0 +1,52 @@
+__author__ = 'Jan Bogaerts'
+__copyright__ = "Copyright 2016, AllThingsTalk"
+__credits__ = []
+__maintainer__ = "Jan Bogaerts"
+__email__ = "jb@allthingstalk.com"
+__status__ = "Prototype"  # "Development", or "Production"
+
+# packs the images of every skin into a texture atlas (skin.atlas + skin-0.png in the skin directory), so that all the
+# images of a skin share 1 texture. Run this before packaging the app, after adding or changing skins:
+#   python buildatlas.py [skins directory] [atlas size]
+# styleManager uses the atlas when there is one, otherwise the separate images are loaded.
+
+import os
+import sys
+import json
+from kivy.atlas import Atlas
+
+import styleManager as sm
+
+_imageExtensions = ('.png', '.jpg', '.jpeg')
+
+
+def getImages(skinPath):
+    """the images of the skin that are used by the controls. The example image is only shown in the asset dialog, so
+    it's left out, unless a control uses it as well."""
+    with open(os.path.join(skinPath, 'definition.json')) as data_file:
+        definition = json.load(data_file)
+    used = set(value for key, value in definition.iteritems() if key != 'example' and isinstance(value, basestring))
+    used = set(os.path.splitext(value)[0] for value in used)                 # some skins refer to an image without the extension
+    result = []
+    for fileName in os.listdir(skinPath):
+        name, ext = os.path.splitext(fileName)
+        if ext.lower() in _imageExtensions and name in used:
+            result.append(os.path.join(skinPath, fileName))
+    return result
+
+def buildAtlases(path, size = 1024):
+    for type in os.listdir(path):
+        typePath = os.path.join(path, type)
+        if not os.path.isdir(typePath):
+            continue
+        for skinName in os.listdir(typePath):
+            skinPath = os.path.join(typePath, skinName)
+            if os.path.isfile(os.path.join(skinPath, 'definition.json')):
+                images = getImages(skinPath)
+                if images:
+                    print "packing {} images of '{}/{}'".format(len(images), type, skinName)
+                    Atlas.create(os.path.join(skinPath, sm.atlasName), images, size)
+
+
+if __name__ == '__main__':
+    buildAtlases(sys.argv[1] if len(sys.argv) > 1 else 'skins', int(sys.argv[2]) if len(sys.argv) > 2 else 1024)
@@ -9,10 +9,13 @@ __status__ = "Prototype"  # "Development", or "Production"
 # we have to do this, cause the objects Application and MainWindow don't appear to have the same context when on_puuse and on_resume
 # are called, making it hard to share module-global variables or fields on 'Application'
 
+import snapshot
+
 data = None
 fileName = None
 config = None
 
 def save():
     if data:
-        data.save(fileName)
\ No newline at end of file
+        data.save(fileName)
+        snapshot.save(fileName, data)               # last known values, for a fast startup next time
\ No newline at end of file
@@ -91,6 +91,8 @@ class AssetDialog(Popup):
         self.skinPropertyControls = None            # keep a reference to the controls that were added for editing the skin specific properties
         self.data = data
         self.tempData = copy.copy(data)             # make a shallow copy of the data object which we will be using to edit. It can load stuff
+        self.tempData.skin = dict(data.skin) if data.skin else None     # edited in place, the asset only gets it when the user is done
+        self.tempData.skinChanged()
         if data.control:
             self.selectedSkin = sm.getSkin(data.control.controlType, data)
         self.parentW = None  # for new items
@@ -123,6 +125,7 @@ class AssetDialog(Popup):
                 self.tempData.skin["control"] = btn.text
             else:
                 self.tempData.skin = {'control': btn.text}
+            self.tempData.skinChanged()
             self.loadUIFromAsset(True)
             btn.parent.parent.dismiss()  #this closes the popup
         except Exception as e:
@@ -261,6 +264,7 @@ class AssetDialog(Popup):
             self.tempData.skin["name"] = skin["name"]
         else:
             self.tempData.skin = {'name': skin["name"]}
+        self.tempData.skinChanged()
         if 'example' in skin:
             self.selectedSkinExample.source = os.path.join(skin['path'], skin['example'])
         else:
@@ -274,6 +278,7 @@ class AssetDialog(Popup):
             self.tempData.skin["size"] = size
         else:
             self.tempData.skin = {'size': size}
+        self.tempData.skinChanged()
         self.selectedSkinExample.size = sm.getControlSize(self.selectedSkin, self.tempData)
 
     def done(self):
@@ -282,6 +287,7 @@ class AssetDialog(Popup):
                 self.data.id = self.tempData.id
                 self.data.unload()
                 self.data.skin = self.tempData.skin
+                self.data.skinChanged()
                 self.data.load()                # reload the asset data so the control can be rerendered
                 self.data.skin['title'] = self.tempData.title       # do after loading, otherwise we loose the value, this is for storage.
                 self.data.title = self.tempData.title               # this is for ui
@@ -321,6 +327,7 @@ class CredentialsDialog(Popup):
 
     serverInput = ObjectProperty()
     brokerInput = ObjectProperty()
+    mqttCommandsInput = ObjectProperty()
 
     def __init__(self, main, forNewLayout, **kwargs):
         self.main = main
@@ -336,6 +343,7 @@ class CredentialsDialog(Popup):
             self.brokerInput.text = main.data.broker
         else:
             self.brokerInput.text = 'broker.smartliving.io'
+        self.mqttCommandsInput.active = main.data.commandTransport == 'mqtt'
 
 
 
@@ -345,6 +353,10 @@ class CredentialsDialog(Popup):
         self.main.data.password = self.pwdInput.text
         self.main.data.server = self.serverInput.text
         self.main.data.broker = self.brokerInput.text
+        if self.mqttCommandsInput.active:
+            self.main.data.commandTransport = 'mqtt'
+        else:
+            self.main.data.commandTransport = 'http'
 
         self.main.setCredentialsDone(self.isNew)
 
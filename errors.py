@@ -32,10 +32,12 @@ def showErrorMsg(msg):
 
 
 _reconnectPopup = None
+_reconnectLabel = None
 
 def _reconectClosed(parame):
-    global _reconnectPopup
+    global _reconnectPopup, _reconnectLabel
     _reconnectPopup = None
+    _reconnectLabel = None
 
 
 def closeReconnectError():
@@ -44,9 +46,13 @@ def closeReconnectError():
         _reconnectPopup.dismiss()
 
 def showReconnectError(msg):
-    """call this to show an error message for internet reconection issues. While the dialog is open"""
-    global _reconnectPopup
+    """call this to show an error message for internet reconection issues. While the dialog is open, new messages
+    replace the text of the dialog."""
+    global _reconnectPopup, _reconnectLabel
+    text = "Failed to reconnect network, please check your network settings. Error: {}".format(msg)
     if not _reconnectPopup:
-        lbl = Label(text= "Failed to reconnect network, please check your network settings. Error: {}".format(msg), size=(400, 300), text_size=(400, 300), halign='center', valign='middle')
-        _reconnectPopup = Popup(title='connection', content=lbl, size_hint=(None, None), size=(400, 300), auto_dismiss=False, on_dismiss=_reconectClosed)
-        _reconnectPopup.open()
\ No newline at end of file
+        _reconnectLabel = Label(text=text, size=(400, 300), text_size=(400, 300), halign='center', valign='middle')
+        _reconnectPopup = Popup(title='connection', content=_reconnectLabel, size_hint=(None, None), size=(400, 300), auto_dismiss=False, on_dismiss=_reconectClosed)
+        _reconnectPopup.open()
+    else:
+        _reconnectLabel.text = text
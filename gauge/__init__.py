@@ -12,12 +12,15 @@ The :class:`Gauge` widget is a widget for displaying gauge.
 
 Source svg file provided for customing.
 
+The dial, needle and value are drawn with canvas instructions on a single widget. A value change only updates the
+angle of the needle and the rectangles that show the digits (see numericlabel).
+
 '''
 
 __all__ = ('Gauge',)
 
 __title__ = 'garden.gauge'
-__version__ = '0.2'
+__version__ = '0.3'
 __author__ = 'julien@hautefeuille.eu'
 
 import kivy
@@ -30,92 +33,98 @@ from kivy.properties import StringProperty
 from kivy.properties import BoundedNumericProperty
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.widget import Widget
-from kivy.uix.scatter import Scatter
-from kivy.uix.image import Image
-from kivy.uix.label import Label
-from kivy.uix.progressbar import ProgressBar
+from kivy.graphics import Color, Rectangle, Rotate, PushMatrix, PopMatrix
+from numericlabel import GlyphText
+from textures import preloader
 import os,inspect
 
-class DummyClass: pass
-
 class Gauge(Widget):
     '''
     Gauge class
 
     '''
 
-    dummy = DummyClass
     unit = NumericProperty(1.8)
     value = BoundedNumericProperty(0, min=0, max=100, errorvalue=0)
-    #mypath = os.path.dirname(os.path.abspath(inspect.getsourcefile(dummy)))
-    file_gauge = StringProperty("skins/gauge/default/cadran.png") # mypath + os.sep +
+    file_gauge = StringProperty("skins/gauge/default/cadran.png")
     file_needle = StringProperty("skins/gauge/default/needle.png")
     size_gauge = BoundedNumericProperty(128, min=128, max=256, errorvalue=128)
     size_text = NumericProperty(10)
 
     def __init__(self, **kwargs):
+        self._label = None
         super(Gauge, self).__init__(**kwargs)
-        
-            
-        self._gauge = Scatter(
-            size=(self.size_gauge, self.size_gauge),
-            do_rotate=False, 
-            do_scale=False,
-            do_translation=False
-            )
-
-        _img_gauge = Image(source=self.file_gauge, size=(self.size_gauge, 
-            self.size_gauge))
-
-        self._needle = Scatter(
-            size=(self.size_gauge, self.size_gauge),
-            do_rotate=False,
-            do_scale=False,
-            do_translation=False
-            )
-
-        _img_needle = Image(source=self.file_needle, size=(self.size_gauge, 
-            self.size_gauge))
-
-        self._glab = Label(font_size=self.size_text, markup=True)
-        self._progress = ProgressBar(max=100, height=20, value=self.value)
-       
-        self._gauge.add_widget(_img_gauge)
-        self._needle.add_widget(_img_needle)
-        
-        self.add_widget(self._gauge)
-        self.add_widget(self._needle)
-        self.add_widget(self._glab)
-        self.add_widget(self._progress)
+        with self.canvas:
+            Color(1, 1, 1, 1)
+            self._dial = Rectangle()
+            PushMatrix()
+            self._rotate = Rotate(angle=0, axis=(0, 0, 1))
+            self._needle = Rectangle()
+            PopMatrix()
+        self._setImage(self._dial, self.file_gauge)
+        self._setImage(self._needle, self.file_needle)
+        self._createText()
 
         self.bind(pos=self._update)
         self.bind(size=self._update)
+        self.bind(size_gauge=self._update)
+        self.bind(size_text=self._createText)
         self.bind(value=self._turn)
-        
+        self.bind(file_gauge=self._setDial)
+        self.bind(file_needle=self._setNeedle)
+        self._update()
+        self._turn()
+
+    def _setDial(self, instance, value):
+        self._setImage(self._dial, value)
+
+    def _setNeedle(self, instance, value):
+        self._setImage(self._needle, value)
+
+    def _setImage(self, rect, source):
+        '''
+        Use the texture that was decoded in the background, only load the file if there is none.
+
+        '''
+        texture = preloader.getTexture(source)
+        if texture:
+            rect.texture = texture
+        else:
+            rect.source = source
+
     def _update(self, *args):
         '''
         Update gauge and needle positions after sizing or positioning.
 
         '''
-        self._gauge.pos = self.pos
-        self._needle.pos = (self.x, self.y)
-        self._needle.center = self._gauge.center
-        self._glab.center_x = self._gauge.center_x
-        self._glab.center_y = self._gauge.center_y + (self.size_gauge/4)
-        self._progress.x = self._gauge.x
-        self._progress.y = self._gauge.y + (self.size_gauge / 4)
-        self._progress.width = self.size_gauge
+        size = (self.size_gauge, self.size_gauge)
+        self._dial.pos = self.pos
+        self._dial.size = size
+        self._needle.pos = self.pos
+        self._needle.size = size
+        self._rotate.origin = (self.x + self.size_gauge / 2.0, self.y + self.size_gauge / 2.0)
+        self._placeText()
 
     def _turn(self, *args):
         '''
         Turn needle, 1 degree = 1 unit, 0 degree point start on 50 value.
 
         '''
-        self._needle.center_x = self._gauge.center_x
-        self._needle.center_y = self._gauge.center_y
-        self._needle.rotation = (50 * self.unit) - (self.value * self.unit)
-        self._glab.text = "[b]{0:.0f}[/b]".format(self.value)
-        self._progress.value = self.value
+        self._rotate.angle = (50 * self.unit) - (self.value * self.unit)
+        self._label.setText("{0:.0f}".format(self.value))
+        self._placeText()
+
+    def _createText(self, *args):
+        if self._label:
+            self.canvas.remove(self._label)
+        self._label = GlyphText(self.size_text, True)
+        self.canvas.add(self._label)
+        self._label.setText("{0:.0f}".format(self.value))
+        self._placeText()
+
+    def _placeText(self):
+        self._label.setPos(int(self.x + (self.size_gauge - self._label.width) / 2.0),
+                           int(self.y + self.size_gauge * 0.75 - self._label.height / 2.0))
 
 
 dirflag = 1
@@ -48,6 +48,7 @@ from kivy.properties import NumericProperty, ObjectProperty, StringProperty,\
     BooleanProperty, ReferenceListProperty, BoundedNumericProperty,\
     ListProperty
 import math
+from numericlabel import NumericLabel                   # registers the class for the kv rule
 
 Builder.load_string('''
 <Knob>
@@ -95,9 +96,10 @@ Builder.load_string('''
             source: self.knobimg_source
     canvas:
         PopMatrix
-    Label:
+    NumericLabel:
         id: _label
         text: "%.f"%(root.value)
+        size: self.texture_size
         center: root.center
         font_size: root.font_size
         color: root.font_color
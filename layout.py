@@ -6,7 +6,8 @@ __email__ = "jb@allthingstalk.com"
 __status__ = "Prototype"  # "Development", or "Production"
 
 import json
-from kivy.properties import BooleanProperty, NumericProperty, StringProperty
+import weakref
+from kivy.properties import BooleanProperty, NumericProperty, StringProperty, ObjectProperty
 from kivy.uix.togglebutton import ToggleButton
 from kivy.uix.label import Label
 from kivy.uix.slider import Slider
@@ -16,15 +17,23 @@ from kivy.event import EventDispatcher
 from kivy.uix.checkbox import CheckBox
 from kivy.uix.gridlayout import GridLayout
 from kivy.uix.spinner import Spinner
+from kivy.clock import mainthread
 import attiotuserclient as IOT
 import styleManager as sm
+from workers import WorkerPool
+from updatequeue import updates
+from textures import preloader
 from knob import Knob
 from gauge import Gauge
+from numericlabel import NumericLabel
 import os
+import logging
 
 from errors import *
 from genericwidgets import SliderExt
 
+assetLoader = WorkerPool(6, 'asset-loader')                     # fetches asset definitions in the background, so opening a group doesn't block the ui.
+
 class BaseIO(EventDispatcher):
     def __init__(self, asset, type, **kwargs):
         self.asset = asset
@@ -42,6 +51,25 @@ class BaseIO(EventDispatcher):
     def getPropertyEditors(self, skin):
         return []
 
+    def getImages(self):
+        """the image files (or atlas urls) that the ui element will use"""
+        return sm.getStyle(self.controlType, self.asset).getImages()
+
+    def sendValue(self, value):
+        """send the value to the cloud in the background, so the ui doesn't block. Values that are still
+        waiting to be sent are replaced by newer ones, failures are retried (could be that the user was really quick and
+        the connection was not setup yet, on mobile after turning dev on when app was open)"""
+        IOT.sendAsync(self.asset.id, value, self._sendDone)
+
+    @mainthread
+    def _sendDone(self, id, value, error):
+        """called when the command was sent (or failed to)"""
+        if error:
+            if error.message:
+                showError(error)
+            else:
+                showErrorMsg("There was a communication problem, please try again")
+
 class SwitchInput(BaseIO):
     value = BooleanProperty(False)
     def __init__(self, value, asset, **kwargs):
@@ -63,10 +91,10 @@ class SwitchInput(BaseIO):
         result = ToggleButton()
         if self.value:
             result.state = 'down'
-        skin = sm.getSkin('switch', self.asset)
-        result.background_normal = os.path.join(skin['path'], skin["normal"])
-        result.background_down = os.path.join(skin['path'], skin["down"])
-        result.size = sm.getControlSize(skin, self.asset)
+        style = sm.getStyle('switch', self.asset)
+        result.background_normal = style.getFile("normal")
+        result.background_down = style.getFile("down")
+        result.size = style.size
         result.border = 0,0,0,0
         self.uiEl = result
         self.prepareUiElement()
@@ -75,20 +103,7 @@ class SwitchInput(BaseIO):
 
     def state_changed(self, instance, value):
         if self._updatingValue == False:  # don't send to cloud if cloud just updated the ui element.
-            retryCount = 0
-            isSent = False
-            while not isSent and retryCount < 5:  # we retry a couply of times, could be that the user was really quick and the connection was not setup yet (on mobile after turning dev on when app was open)
-                try:
-                    IOT.send(self.asset.id, value == "down")
-                    isSent = True
-                except Exception as e:
-                    if retryCount < 5:
-                        retryCount += 1
-                    else:
-                        if e.message:
-                            showError(e)
-                        else:
-                            showErrorMsg("There was a communication problem, please try again")
+            self.sendValue(value == "down")
 
 class draggableInput(BaseIO):
     """base class for inputs that work with drag moves, like the knob and slider.
@@ -134,18 +149,21 @@ class draggableInput(BaseIO):
             self.asset.skin = {'show_label': value}
         else:
             self.asset.skin['show_label'] = value
+        self.asset.skinChanged()
 
     def on_send_on_release_Changed(self, checkbox, value):
         if not self.asset.skin:
             self.asset.skin = {'send_on_release': value}
         else:
             self.asset.skin['send_on_release'] = value
+        self.asset.skinChanged()
 
     def on_show_markerChanged(self, checkbox, value):
         if not self.asset.skin:
             self.asset.skin = {'show_marker': value}
         else:
             self.asset.skin['show_marker'] = value
+        self.asset.skinChanged()
 
 class sliderInput(draggableInput):
     value = NumericProperty()
@@ -171,48 +189,32 @@ class sliderInput(draggableInput):
         result = Slider()  #SliderExt()
         if self.value:
             result.value = self.value
-        skin = sm.getSkin('slider', self.asset)
-        result.size = sm.getControlSize(skin, self.asset)
-        result.orientation = sm.getVar(skin, self.asset, "orientation")
-        result.min = sm.getMinimum('slider', self.value, self._typeInfo)
-        result.max = sm.getMaximum('slider', self.value, self._typeInfo)
-        result.step = sm.getStep('slider', self._typeInfo)
-        result.show_label = sm.getVar(skin,  self.asset, "show_label")
-        result.show_marker = sm.getVar(skin, self.asset, "show_marker")
+        style = sm.getStyle('slider', self.asset)
+        result.size = style.size
+        result.orientation = style.get("orientation")
+        result.min, result.max, result.step = style.getRange(self.value, self._typeInfo)
+        result.show_label = style.get("show_label")
+        result.show_marker = style.get("show_marker")
 
         self.uiEl = result
         self.prepareUiElement()
-        if sm.getVar(skin, self.asset, "send_on_release", False):
+        if style.get("send_on_release", False):
             result.on_dragEnded = self.value_changed                    # set the callback for when drag ends (self made, so no binding)
         else:
             result.bind(value=self.value_changed)
         return result
 
     def value_changed(self, instance, value):
-        retryCount = 0
-        isSent = False
         if self._updatingValue == False:  # don't send to cloud if cloud just updated the ui element.
-            while not isSent and retryCount < 5:                    # we retry a couply of times, could be that the user was really quick and the connection was not setup yet (on mobile after turning dev on when app was open)
-                try:
-                    min = sm.getMinimum('slider', self.value, self._typeInfo)   # snap to borders, so it's easy to set min and max values.
-                    max = sm.getMaximum('slider', self.value, self._typeInfo)
-                    if value < min + 5:
-                        value = min
-                    elif value > max - 5:
-                        value = max
-                    if self._typeInfo['type'] == 'number':
-                        IOT.send(self.asset.id, value)
-                    else:
-                        IOT.send(self.asset.id, int(value))     # if the cloud expects ints, we can't send something like 1.0
-                    isSent = True
-                except Exception as e:
-                    if retryCount < 5:
-                        retryCount += 1
-                    else:
-                        if e.message:
-                            showError(e)
-                        else:
-                            showErrorMsg("There was a communication problem, please try again")
+            min, max, step = sm.getStyle('slider', self.asset).getRange(self.value, self._typeInfo)  # snap to borders, so it's easy to set min and max values.
+            if value < min + 5:
+                value = min
+            elif value > max - 5:
+                value = max
+            if self._typeInfo['type'] == 'number':
+                self.sendValue(value)
+            else:
+                self.sendValue(int(value))     # if the cloud expects ints, we can't send something like 1.0
 
 class knobInput(draggableInput):
     value = NumericProperty()
@@ -238,43 +240,28 @@ class knobInput(draggableInput):
         result = Knob()
         if self.value:
             result.value = self.value
-        skin = sm.getSkin('knob', self.asset)
-        result.size = sm.getControlSize(skin, self.asset)
-        result.knobimg_source = os.path.join(skin['path'], skin["knob"])
-        result.marker_img = os.path.join(skin['path'], skin['marker'])
-        result.min = sm.getMinimum('knob', self.value, self._typeInfo)
-        result.max = sm.getMaximum('knob', self.value, self._typeInfo)
-        result.step = sm.getStep('knob', self._typeInfo)
-        result.show_label = sm.getVar(skin,  self.asset, "show_label", False)
-        result.show_marker = sm.getVar(skin, self.asset, "show_marker", False)
+        style = sm.getStyle('knob', self.asset)
+        result.size = style.size
+        result.knobimg_source = style.getFile("knob")
+        result.marker_img = style.getFile("marker")
+        result.min, result.max, result.step = style.getRange(self.value, self._typeInfo)
+        result.show_label = style.get("show_label", False)
+        result.show_marker = style.get("show_marker", False)
 
         self.uiEl = result
         self.prepareUiElement()
-        if sm.getVar(skin, self.asset, "send_on_release", False):
+        if style.get("send_on_release", False):
             result.on_dragEnded = self.value_changed                    # set the callback for when drag ends (self made, so no binding)
         else:
             result.bind(value=self.value_changed)
         return result
 
     def value_changed(self, instance, value):
-        retryCount = 0
-        isSent = False
         if self._updatingValue == False:  # don't send to cloud if cloud just updated the ui element.
-            while not isSent and retryCount < 5:  # we retry a couply of times, could be that the user was really quick and the connection was not setup yet (on mobile after turning dev on when app was open)
-                try:
-                    if self._typeInfo['type'] == 'number':
-                        IOT.send(self.asset.id, value)
-                    else:
-                        IOT.send(self.asset.id, int(value))     # if the cloud expects ints, we can't send something like 1.0
-                    isSent = True
-                except Exception as e:
-                    if retryCount < 5:
-                        retryCount += 1
-                    else:
-                        if e.message:
-                            showError(e)
-                        else:
-                            showErrorMsg("There was a communication problem, please try again")
+            if self._typeInfo['type'] == 'number':
+                self.sendValue(value)
+            else:
+                self.sendValue(int(value))     # if the cloud expects ints, we can't send something like 1.0
 
 
 class LedOutput(BaseIO):
@@ -298,10 +285,10 @@ class LedOutput(BaseIO):
         result = ToggleButton()
         if self.value:
             result.state = 'down'
-        skin = sm.getSkin('led', self.asset)
-        result.background_normal = os.path.join(skin['path'], skin['normal'])
-        result.background_down = os.path.join(skin['path'], skin['down'])
-        result.size = sm.getControlSize(skin, self.asset)
+        style = sm.getStyle('led', self.asset)
+        result.background_normal = style.getFile("normal")
+        result.background_down = style.getFile("down")
+        result.size = style.size
         result.border = [0, 0, 0, 0]
         self.uiEl = result
         self.prepareUiElement()
@@ -329,11 +316,9 @@ class GaugeOutput(BaseIO):
 
     def getUI(self):
         """get the ui element"""
-        result = Gauge()
-        skin = sm.getSkin('gauge', self.asset)
-        result.size = sm.getControlSize(skin, self.asset)
-        result.file_gauge = os.path.join(skin['path'], skin['gauge'])
-        result.file_needle = os.path.join(skin['path'], skin['needle'])
+        style = sm.getStyle('gauge', self.asset)
+        result = Gauge(file_gauge=style.getFile("gauge"), file_needle=style.getFile("needle"))     # set the images right away, so the default ones don't get loaded
+        result.size = style.size
         #self.min = sm.getMinimum('gauge', self.value, self._typeInfo)
         #self.max = sm.getMaximum('gauge', self.value, self._typeInfo)
         self.min = 0                                        #temp fix, gauge needs to be updated so it can handle values better
@@ -367,11 +352,10 @@ class MeterOutput(BaseIO):
     def getUI(self):
         """get the ui element"""
         result = ProgressBar()
-        skin = sm.getSkin('meter', self.asset)
-        result.size = sm.getControlSize(skin, self.asset)
+        style = sm.getStyle('meter', self.asset)
+        result.size = style.size
 
-        result.min = sm.getMinimum('meter', self.value, self._typeInfo)
-        result.max = sm.getMaximum('meter', self.value, self._typeInfo)
+        result.min, result.max, step = style.getRange(self.value, self._typeInfo)
         if self.value:
             result.value = self.value
 
@@ -390,7 +374,8 @@ class TextboxInput(BaseIO):
     def on_value(self, instance, value):
         self._updatingValue = True
         try:
-            self.uiEl.text = str(value)
+            if self.uiEl:
+                self.uiEl.text = str(value)
         finally:
             self._updatingValue = False
 
@@ -406,8 +391,8 @@ class TextboxInput(BaseIO):
             result = TextInput()
         if self.value:
             result.text = self.value.lower()
-        skin = sm.getSkin('text', self.asset)
-        result.size = sm.getControlSize(skin, self.asset)
+        style = sm.getStyle('text', self.asset)
+        result.size = style.size
 
         self.uiEl = result
         self.prepareUiElement()
@@ -415,24 +400,11 @@ class TextboxInput(BaseIO):
         return result
 
     def value_changed(self, instance, value):
-        retryCount = 0
-        isSent = False
         if self._updatingValue == False:  # don't send to cloud if cloud just updated the ui element.
-            while not isSent and retryCount < 5:  # we retry a couply of times, could be that the user was really quick and the connection was not setup yet (on mobile after turning dev on when app was open)
-                try:
-                    IOT.send(self.asset.id, value)
-                    isSent = True
-                except Exception as e:
-                    if retryCount < 5:
-                        retryCount += 1
-                    else:
-                        if e.message:
-                            showError(e)
-                        else:
-                            showErrorMsg("There was a communication problem, please try again")
+            self.sendValue(value)
 
 class TextOutput(BaseIO):
-    value = StringProperty()
+    value = ObjectProperty('')                                      # the cloud sends numbers as numbers, they are converted to text when shown
     def __init__(self, value, typeInfo, asset, **kwargs):
         self.value = value
         self._typeInfo = typeInfo
@@ -442,24 +414,150 @@ class TextOutput(BaseIO):
         self._updatingValue = True
         try:
             if self.uiEl:
-                self.uiEl.text = value
+                self.uiEl.text = self.getText()
         finally:
             self._updatingValue = False
 
+    def getText(self):
+        if self.value is None:
+            return u''
+        return unicode(self.value)                                  # in case not a string type
+
     def getUI(self):
         """get the ui element"""
-        result = Label()
-        skin = sm.getSkin('label', self.asset)
-        result.text_size = sm.getControlSize(skin, self.asset)
-        result.bind(texture_size=self.setter('size'))
-        if self.value:
-            result.text = self.value
+        style = sm.getStyle('label', self.asset)
+        if self._typeInfo and self._typeInfo.get('type') in ('number', 'integer'):
+            result = NumericLabel()                                 # numbers can change often, this doesn't render a new texture for every value
+            result.size = style.size                                # the value is centered in the box of the skin, like the text of a Label
+        else:
+            result = Label()
+            result.text_size = style.size
+            result.bind(texture_size=self.setter('size'))
+        result.text = self.getText()
 
         self.uiEl = result
         self.prepareUiElement()
         return result
 
+class AssetRecord:
+    """
+    the data of an asset as it is known in the cloud: definition, last value and subscription.
+    An asset can be placed multiple times in a layout (Asset objects), all those placements share 1 record, so the
+    asset is only fetched and monitored once, no matter how many times it is shown.
+    """
+    def __init__(self, id):
+        self.id = id
+        self.data = None                                            # the asset definition, as returned by the cloud
+        self.state = None                                           # the last known value
+        self.isLoaded = False
+        self.isProvisional = False                                  # true when the data only contains what was stored in the snapshot, the full definition still has to be fetched.
+        self.isSubscribed = False
+        self.views = weakref.WeakSet()                              # the Asset objects that show this record and want to be notified of value changes. A placement that is gone without unsubscribing doesn't stay in here.
+        self._loadCallbacks = None                                  # when a background load is running, the list of functions to call when done.
+
+    def setData(self, data, provisional = False):
+        """
+        :param provisional: true if the data is not the full definition (restored from the snapshot), it is replaced
+                            by the definition from the cloud at the next load.
+        """
+        self.data = data
+        self.state = data['state']
+        self.isLoaded = True
+        self.isProvisional = provisional
+
+    def getData(self):
+        """the definition of the asset, with the last known value"""
+        result = dict(self.data)
+        result['state'] = self.state
+        return result
+
+    def load(self):
+        """make certain that the definition is loaded, fetches it if needed. Returns the definition"""
+        if not self.isLoaded or self.isProvisional:
+            data = IOT.getAsset(self.id, not self.isProvisional)        # the cache was saved together with the snapshot, so it can be just as old
+            if not data:
+                return None
+            self.setData(data)
+        return self.getData()
+
+    def loadAsync(self, callback):
+        """fetch the asset data on a background thread.
+        :param callback: function(record, error), called on the ui thread when done. error is None if all went well.
+        When a load is already running for this asset, the callback is called when that one is done."""
+        if self.isLoaded and not self.isProvisional:
+            callback(self, None)
+        elif self._loadCallbacks is not None:
+            self._loadCallbacks.append(callback)
+        else:
+            self._loadCallbacks = [callback]
+            assetLoader.submit(IOT.getAsset, (self.id, not self.isProvisional), lambda data: self._asyncLoaded(data, None), lambda e: self._asyncLoaded(None, e))
+
+    @mainthread
+    def _asyncLoaded(self, data, error):
+        """called on the ui thread when the background fetch is done"""
+        callbacks = self._loadCallbacks
+        self._loadCallbacks = None
+        if not error and data:
+            self.setData(data)
+        for callback in callbacks:
+            callback(self, error)
+
+    def addView(self, view):
+        """register a placement of the asset, so that it gets the value changes. Starts monitoring the cloud if needed."""
+        self.views.add(view)
+        if not self.isSubscribed:
+            self.isSubscribed = True
+            IOT.subscribe(self.id, self._postValue)
+
+    def removeView(self, view):
+        """unregister a placement. When the last one is gone, we stop monitoring the cloud."""
+        self.views.discard(view)
+        if not self.views and self.isSubscribed:
+            self.isSubscribed = False
+            IOT.unsubscribe(self.id, 'asset', self._postValue)
+
+    def resubscribe(self):
+        """monitor the cloud again after all the subscriptions were removed (new credentials)"""
+        self.isSubscribed = False
+        if self.views:
+            self.isSubscribed = True
+            IOT.subscribe(self.id, self._postValue)
+
+    def _postValue(self, value):
+        """called on the mqtt network thread when a value arrives, moves it to the ui thread.
+        If more values arrive before the next frame, only the last one is shown."""
+        updates.post(self, self._valueChanged, value)
+
+    def _valueChanged(self, value):
+        """called on the ui thread when the cloud has reported a value change for this asset"""
+        self.state = value
+        for view in list(self.views):
+            view._valueChanged(value)
+
+
+_records = weakref.WeakValueDictionary()                            # asset id -> AssetRecord, a record lives as long as a placement refers to it.
+
+def clearRecords():
+    """forget all the asset records, call this when the connection was closed for good (other layout is loaded)"""
+    _records.clear()
+
+def resubscribeRecords():
+    """call this after the connection was closed and opened again without keeping the subscriptions"""
+    for record in _records.values():
+        record.resubscribe()
+
+def getRecord(id):
+    """get the shared record for the asset with the specified id"""
+    result = _records.get(id)
+    if result is None:
+        result = AssetRecord(id)
+        _records[id] = result
+    return result
+
+
 class Asset:
+    """a placement of an asset in the layout. The data that comes from the cloud is shared with all the other
+    placements of the same asset through the 'record'."""
     def __init__(self, parent, id):
         self.parent = parent
         self.isLoaded = False
@@ -467,12 +565,44 @@ class Asset:
         self.title = ""
         self.control = None
         self.skin = None
+        self.styles = {}                                            # control type -> ResolvedStyle, filled by styleManager.getStyle
+        self._subscribedTo = None                                   # the record that sends us value changes
+        self._record = None                                         # keeps the shared record alive
+
+    @property
+    def record(self):
+        if self._record is None or self._record.id != self.id:     # the id can be changed by the asset dialog
+            self._record = getRecord(self.id)
+        return self._record
 
     def load(self, subscribe = True):
         """load all the data for the asset. At this point, we also register with the broker
         returns the asset object that was retrieved from the platform"""
-        data = IOT.getAsset(self.id)
+        data = self.record.load()
+        self.loadFromData(data, subscribe)
+        return data
+
+    def loadAsync(self, callback, subscribe = True):
+        """fetch the asset data on a background thread (if it's not yet known) and load it.
+        :param callback: function(asset, error), called on the ui thread when done. error is None if all went well."""
+        self.record.loadAsync(lambda record, error: self._asyncLoaded(record, error, callback, subscribe))
+
+    def _asyncLoaded(self, record, error, callback, subscribe):
+        """called on the ui thread when the background fetch is done, builds the control"""
+        if not error:
+            try:
+                self.loadFromData(record.getData(), subscribe)
+            except Exception as e:
+                logging.exception("failed to load asset")
+                error = e
+        callback(self, error)
+
+    def loadFromData(self, data, subscribe = True, provisional = False):
+        """build the control from the asset data that was retrieved from the platform.
+        :param provisional: true if the data was restored from the snapshot and isn't the full definition."""
         if data:
+            if not self.record.isLoaded or (self.record.isProvisional and not provisional):
+                self.record.setData(data, provisional)
             if self.skin and 'title' in self.skin:          # if user overwote the title, use that value, otherwise use the default value from the cloud
                 self.title = self.skin['title']
             else:
@@ -484,16 +614,47 @@ class Asset:
             else:
                 self.control = self.getControlFromCloud(data['control'], data['state'])
             self.isLoaded = True
+            if self.control:
+                preloader.preload(self.control.getImages())         # decode the images in the background, before the control is shown
             if subscribe:
-                IOT.subscribe(self.id, self._valueChanged)
-        return data
+                self.subscribe()
+
+    def getLoadingSize(self):
+        """the size to reserve for the control while the asset is being loaded: the size of the skin that the user
+        selected, otherwise the default control size (the type of control is only known after loading)."""
+        if self.control:
+            return sm.getStyle(self.control.controlType, self).size
+        if self.skin and 'control' in self.skin:
+            return sm.getStyle(self.skin['control'], self).size
+        return sm.getControlSize(None, None)
+
+    def subscribe(self):
+        """start monitoring the cloud for value changes of this asset"""
+        self._subscribedTo = self.record
+        self._subscribedTo.addView(self)
+
+    @property
+    def isSubscribed(self):
+        return self._subscribedTo is not None
+
+    def unsubscribe(self):
+        """stop receiving value changes"""
+        if self._subscribedTo:
+            self._subscribedTo.removeView(self)
+            self._subscribedTo = None
 
     def unload(self):
+        self.unsubscribe()                                          # the id can change while unloaded (asset dialog), so detach from the current record
         self.isLoaded = False
         self.control = None
         self.skin = None
+        self.skinChanged()
         self.title = ''
 
+    def skinChanged(self):
+        """call this after changing 'skin', so that the styles of the controls are resolved again"""
+        self.styles = {}                                            # a new dict: copies of the asset (asset dialog) keep their own
+
     def loadSecure(self, subscribe = True):
         """load all the data for the asset. At this point, we also register with the broker
         returns the asset object that was retrieved from the platform"""
@@ -591,7 +752,7 @@ class Asset:
         return self.control
 
     def _valueChanged(self, value):
-        """called when the cloud has reported a value change for this asset"""
+        """called by the record, on the ui thread, when the cloud has reported a value change for this asset"""
         if self.control:
             if 'value' in value:
                 self.control.value = value['value']
@@ -599,6 +760,7 @@ class Asset:
                 self.control.value = value['Value']
 
     def delete(self):
+        self.unsubscribe()
         self.parent.assets.remove(self)
 
 class Section:
@@ -608,6 +770,8 @@ class Section:
         self.isExpanded = True
         self.assets = []
     def delete(self):
+        for asset in self.assets:
+            asset.unsubscribe()
         self.parent.sections.remove(self)
 
 class Group(EventDispatcher):
@@ -622,6 +786,9 @@ class Group(EventDispatcher):
 
 
     def delete(self):
+        for section in self.sections:
+            for asset in section.assets:
+                asset.unsubscribe()
         self.parent.groups.remove(self)
 
 class Layout:
@@ -632,6 +799,7 @@ class Layout:
         self.password = ''
         self.server = ''
         self.broker = ''
+        self.commandTransport = 'mqtt'                                  # how actuator commands are sent: 'mqtt' (http when the broker is not connected) or 'http'
         self.title = ''
 
     def load(self, filename):
@@ -645,6 +813,8 @@ class Layout:
                 self.password = credentials["password"]
                 self.server = credentials["server"]
                 self.broker = credentials["broker"]
+                if "transport" in credentials:
+                    self.commandTransport = credentials["transport"]
                 for group in data["layout"]:
                     grp = Group(self)
                     self.groups.append(grp)
@@ -670,8 +840,8 @@ class Layout:
     def save(self, filename):
         """save the layout to specified file"""
         with open(filename, 'w') as f:
-            f.write('{{"version":1.0, "credentials":{{"username": "{}", "password": "{}", "server":"{}", "broker": "{}"}}, "layout":['
-                    .format(self.userName, self.password, self.server, self.broker))
+            f.write('{{"version":1.0, "credentials":{{"username": "{}", "password": "{}", "server":"{}", "broker": "{}", "transport": "{}"}}, "layout":['
+                    .format(self.userName, self.password, self.server, self.broker, self.commandTransport))
             for grp in self.groups:
                 if grp != self.groups[0]: f.write(', ')
                 f.write('{{ "group": "{}", "icon": "{}", "isSelected": {}, "sections":['.format(grp.title, grp.icon, str(grp.isSelected).lower()) )
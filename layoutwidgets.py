@@ -6,7 +6,8 @@ __email__ = "jb@allthingstalk.com"
 __status__ = "Prototype"  # "Development", or "Production"
 
 from kivy.uix.widget import Widget
-from kivy.properties import NumericProperty, StringProperty, ObjectProperty
+from kivy.properties import NumericProperty, StringProperty, ObjectProperty, BooleanProperty
+from kivy.uix.label import Label
 from kivy.uix.actionbar import ActionBar
 from kivy.uix.togglebutton import ToggleButton
 from kivy.graphics.vertex_instructions import *
@@ -15,6 +16,7 @@ from kivy.uix.slider import Slider
 import kivy.metrics
 
 from genericwidgets import *
+from textures import preloader
 
 class EditActionBar(ActionBar):
     title = StringProperty("ATT dashboard")
@@ -41,19 +43,84 @@ class EditButton(ToggleButton):
 class InvalidControlWidget(Widget):
     """a widget that is displayed when the control couldn't be loaded"""
 
+class LoadingControlWidget(Widget):
+    """placeholder that is displayed while the asset is being loaded from the cloud. Give it the size that the
+    control will probably have (Asset.getLoadingSize), so the viewport tracker sees how much room the asset takes."""
+
+class ControlPlaceholder(Widget):
+    """takes the place of a control that was released because it scrolled out of view.
+    Placeholders are reused, use getPlaceholder and let AssetWidget.setControl give them back"""
+
+_placeholders = []                                                  # pool of unused ControlPlaceholder objects
+
+def getPlaceholder(size):
+    """get an empty widget of the specified size"""
+    result = _placeholders.pop() if _placeholders else ControlPlaceholder(size_hint=(None, None))
+    result.size = size
+    return result
+
 class AssetWidget(Widget):
     control_container = ObjectProperty(None)
+    title = StringProperty('')
     def __init__(self, data, **kwargs):
         self.data = data
+        self.isMaterialized = False                                 # true when the control (or the error widget) is shown, false for placeholders
+        self.isLoading = False                                      # true while the asset is being fetched from the cloud
         super(AssetWidget, self).__init__(**kwargs)
+        self.title = data.title
+
+    def setControl(self, uiEl):
+        """replace the current control (or placeholder) with the specified ui element"""
+        if len(self.control_container.children) > 1:                   # first child is the label
+            old = self.control_container.children[0]
+            self.control_container.remove_widget(old)
+            if isinstance(old, ControlPlaceholder):
+                _placeholders.append(old)
+        self.control_container.add_widget(uiEl)
+        self.title = self.data.title
+
+    def showControl(self):
+        """build the ui element for the control of the asset and show it. If the images of the control are still
+        being decoded in the background, this is done when they are ready."""
+        self.isMaterialized = True
+        if self.data.control:
+            preloader.preload(self.data.control.getImages(), self._buildControl)
+        else:
+            self.setControl(InvalidControlWidget())
 
+    def _buildControl(self):
+        if self.isMaterialized and self.data.control:              # could have scrolled out of view while loading
+            self.setControl(self.data.control.getUI())
+
+    def releaseControl(self):
+        """replace the ui element of the control with a placeholder of the same size, so that it can be freed.
+        The control keeps track of the value, showControl builds a new ui element with the current value."""
+        if self.isMaterialized and self.data.isLoaded and len(self.control_container.children) > 1:
+            uiEl = self.control_container.children[0]
+            self.setControl(getPlaceholder(uiEl.size))
+            if self.data.control and self.data.control.uiEl is uiEl:
+                self.data.control.uiEl = None                       # stop updating it
+            self.isMaterialized = False
+
+
+class SectionHeader(ButtonBehavior, Label):
+    """the title of a section, collapses or expands the section when pressed"""
 
 class SectionWidget(Widget):
     assets = ObjectProperty(None)
     sectionWidth = NumericProperty(0.33)
+    isExpanded = BooleanProperty(True)
+    title = StringProperty('')
     def __init__(self, data, **kwargs):
         self.data = data
+        self.isPopulated = False                                    # true when the asset widgets were created. A collapsed section has none.
         super(SectionWidget, self).__init__(**kwargs)
+        self.isExpanded = data.isExpanded
+        self.title = data.title
+
+    def toggleExpanded(self):
+        self.isExpanded = not self.isExpanded
+        self.data.isExpanded = self.isExpanded                      # so it gets saved
 
 class GroupMenuItem(ButtonBehavior, Widget):
     """represents a button with text on the menu bar. when clicked, load all the sections of this group on the workspace"""
@@ -10,13 +10,14 @@ import kivy
 kivy.require('1.9.1')   # replace with your current kivy version !
 
 import logging
+import collections
 logging.getLogger().setLevel(logging.INFO)
 
 from kivy.app import App
 from kivy.core.window import Window
 from kivy.uix.dropdown import DropDown
 from kivy.uix.button import Button
-from kivy.clock import Clock
+from kivy.clock import Clock, mainthread
 import kivy.metrics
 import iconfonts
 from ConfigParser import *
@@ -33,11 +34,22 @@ import attiotuserclient as IOT
 import styleManager as sm
 from layoutwidgets import *
 from errors import *
+from reconnect import ReconnectManager
+from viewport import ViewportTracker
+from prefetch import Prefetcher
+from workers import WorkerPool
+import snapshot
 import data as dt
 
 #todo: remove this when profiling is done
 #import cProfile
 
+connector = WorkerPool(1, 'connect')                                # for connecting in the background at startup
+workspaceCacheSize = 5                                              # nr of groups for which the built workspace is kept, so switching back to them is fast.
+prefetcher = Prefetcher()                                           # loads the other groups in the background
+prefetchDelay = 5                                                   # nr of seconds after the connection was made before prefetching starts, so the first screen gets all the bandwidth.
+subscriptionGracePeriod = 30                                        # nr of seconds that the assets of a group keep streaming after it was closed, so switching back and forth doesn't resubscribe every time.
+
 class MainWindow(Widget):
     menu = ObjectProperty(None)
     workspace = ObjectProperty(None)
@@ -49,12 +61,21 @@ class MainWindow(Widget):
         self.selectedItems = set([])
         self.editActionBar = None
         self.sectionWidth = 0.33                                    #default value, assigned to all new sections that get created.
+        self.isConnecting = False                                   # true while connecting in the background at startup
+        self._waitingForConnection = []                             # (asset widget, section widget) of assets that need to be loaded once connected
+        self.restoredAssets = []                                    # assets that were loaded from the snapshot, still need to be brought up to date
+        self._pendingReleases = {}                                  # group -> clock event that stops streaming the assets of the group
+        self._workspaceCache = collections.OrderedDict()            # group -> list of section widgets that were built for it, most recently used last.
+        self.viewport = None                                        # builds the controls that scroll into view, created when the workspace is first used.
+        self._menuDecorations = []                                  # (parent, widget, bindings) for the edit buttons on the menu, so endEdit can remove them
+        self._workspaceDecorations = []                             # same, for the edit buttons in the workspace
         try:
             if Window:
                 Window.softinput_mode = 'below_target'                            # so the screen resizes when the keybaord is shown, otherwise it hides editing.
         except:
             logging.exception('failed to set android specific configs')
         super(MainWindow, self).__init__(**kwargs)
+        reconnector.bind(state=self.onReconnectState)
 
 
 
@@ -81,13 +102,22 @@ class MainWindow(Widget):
             if os.path.isfile(fileName):                                    # could be that it's a new file (first startup) -> default layout gets a default filename
                 dt.data.load(fileName)
             if dt.data.userName and dt.data.password and dt.data.server and dt.data.broker:
-                try:
-                    IOT.connect(dt.data.userName, dt.data.password, dt.data.server, dt.data.broker)
-                except Exception as e:
-                    connectError = True
-                    showError(e, None,  "Failed to connect, please check your account settings or network. ")
-                    raise                                                   # raise the exception again, we don't want the menu to load, cause it will fail
-                self.loadMenu()                                             #must be done after connecting, cause it might have to load assets
+                IOT.setCommandTransport(dt.data.commandTransport)
+                self.restoredAssets = snapshot.restore(fileName, dt.data)
+                if self.restoredAssets:                                     # we know what the screen looked like last time: show that right away and connect in the background
+                    self.isConnecting = True
+                    self.loadMenu()
+                    connector.submit(IOT.connect, (dt.data.userName, dt.data.password, dt.data.server, dt.data.broker),
+                                     lambda result, layout=dt.data: self.onConnected(layout, None), lambda e, layout=dt.data: self.onConnected(layout, e))
+                else:
+                    try:
+                        IOT.connect(dt.data.userName, dt.data.password, dt.data.server, dt.data.broker)
+                    except Exception as e:
+                        connectError = True
+                        showError(e, None,  "Failed to connect, please check your account settings or network. ")
+                        raise                                                   # raise the exception again, we don't want the menu to load, cause it will fail
+                    self.loadMenu()                                             #must be done after connecting, cause it might have to load assets
+                    self.schedulePrefetch()
             else:
                 self.loadMenu()                                             #must be done before editLayout (for new layouts)
                 self.editLayout(None)                                   # there is no connection yet, automatically go to edit mode. Also helps with the button.
@@ -95,6 +125,62 @@ class MainWindow(Widget):
             if not connectError:
                 showError(e)
 
+    @mainthread
+    def onConnected(self, layout, error):
+        """called when the background connect, done at startup, is finished. Brings the assets that were
+        restored from the snapshot up to date and loads the ones that were waiting for the connection.
+        When the connect failed, the reconnect manager keeps on trying and this is called again once it worked."""
+        if layout is not dt.data or not self.isConnecting:                  # user already switched to another layout
+            return
+        if error:
+            logging.error("failed to connect at startup: {}".format(error))
+            reconnector.start()                                             # stays 'connecting' till then, so nothing tries to fetch without a login
+            return
+        self.isConnecting = False
+        waiting = self._waitingForConnection
+        self._waitingForConnection = []
+        if self.selectedGroup:
+            self.activateGroup(self.selectedGroup.data)                     # the restored values can be old
+        self.refreshRestoredAssets(self.restoredAssets)
+        for assetW, sectionW in waiting:
+            self.loadAssetWidget(assetW, sectionW)
+        self.schedulePrefetch()
+        self.restoredAssets = []
+
+    def onReconnectState(self, instance, value):
+        if value == 'connected' and self.isConnecting:                      # the connect at startup failed, the reconnect manager fixed it.
+            self.onConnected(dt.data, None)
+
+    def refreshRestoredAssets(self, assets):
+        """the definitions in the snapshot can be outdated: fetch them again in the background. Controls are only
+        rebuilt for the assets that changed."""
+        for asset in assets:
+            if asset.record.isProvisional:
+                old = asset.record.getData()
+                asset.record.loadAsync(lambda record, error, asset=asset, old=old: self.onRestoredAssetRefreshed(asset, old, error))
+
+    def onRestoredAssetRefreshed(self, asset, old, error):
+        if error:
+            logging.error("failed to refresh the definition of asset {}: {}".format(asset.id, error))
+            return
+        data = asset.record.getData()
+        if any(old[key] != data.get(key) for key in ('title', 'is', 'profile', 'control')):
+            asset.control = None                                            # otherwise getControlFromCloud keeps the one built from the snapshot
+            asset.loadFromData(data, False)                                 # the subscription remains, the values go to the new control
+            for sectionW in self.workspace.children:
+                if isinstance(sectionW, SectionWidget):
+                    for assetW in sectionW.assets.children:
+                        if isinstance(assetW, AssetWidget) and assetW.data is asset and assetW.isMaterialized:
+                            assetW.showControl()
+
+    def schedulePrefetch(self):
+        """load the groups that are not shown in the background, once the first screen had the time to load"""
+        Clock.schedule_once(lambda delta, layout=dt.data: self.startPrefetch(layout), prefetchDelay)
+
+    def startPrefetch(self, layout):
+        if layout is dt.data:                                               # user could have opened another layout in the mean time
+            prefetcher.start(layout.groups)
+
     def loadMenu(self):
         self.menu.clear_widgets()           #clear any possible previous widgets
         for group in dt.data.groups:
@@ -177,6 +263,8 @@ class MainWindow(Widget):
 
     def onNewSectionDone(self, section):
         sectionW = SectionWidget(section, sectionWidth = self.sectionWidth)
+        sectionW.isPopulated = True                                 # a new section has no assets yet
+        sectionW.bind(isExpanded=self.onSectionExpanded)
         self.workspace.add_widget(sectionW, 1)
 
         self.selectedGroup.data.sections.append(section)
@@ -184,9 +272,10 @@ class MainWindow(Widget):
             self.addEditTo(sectionW, 30)
             self.addAddTo(sectionW.assets, self.newAsset, sectionW)
 
-    def editSection(self, section):
+    def editSection(self, section, widget):
         """show a dialog so the user can edit the group"""
         dlg = dialogs.SectionDialog(section, title='edit section')
+        dlg.callback = lambda section: setattr(widget, 'title', section.title)
         dlg.open()
 
 
@@ -216,64 +305,175 @@ class MainWindow(Widget):
         dlg.open()
 
     def onEditAssetDone(self, parentW, asset):
-        if asset.control:
-            uiEl = asset.control.getUI()
-        else:
-            uiEl = InvalidControlWidget()
-        parentW.control_container.remove_widget(parentW.control_container.children[0]) # remove the old widget, addd the new one
-        parentW.control_container.add_widget(uiEl)
+        parentW.showControl()                           # remove the old widget, addd the new one
 
     def addAssetToSection(self, asset, sectionW):
+        """add a widget for the asset to the section. A placeholder is shown until the widget scrolls into view,
+        at that moment the control is built (and the asset is loaded in the background if needed)."""
         assetW = AssetWidget(asset)
         if self.isEditing:
             sectionW.assets.add_widget(assetW, 1)
         else:
             sectionW.assets.add_widget(assetW)
-        if asset.control:
-            uiEl = asset.control.getUI()
-        else:
-            uiEl = InvalidControlWidget()
-
-        assetW.control_container.add_widget(uiEl)
+        assetW.setControl(LoadingControlWidget(size=asset.getLoadingSize()))
+        self.getViewport().refresh()
         return assetW
 
+    def getViewport(self):
+        if not self.viewport:
+            self.viewport = ViewportTracker(self.workspace.parent, self.workspace, self.requestAssetLoad)
+        return self.viewport
+
+    def requestAssetLoad(self, assetW, sectionW):
+        """called when the widget of an asset that isn't loaded yet scrolled into view"""
+        if self.isConnecting:
+            self._waitingForConnection.append((assetW, sectionW))   # can't fetch anything yet, gets loaded when the connection is made
+        else:
+            self.loadAssetWidget(assetW, sectionW)
+
+    def loadAssetWidget(self, assetW, sectionW):
+        """load the asset of the widget in the background and show it's control when done"""
+        assetW.isLoading = True
+        assetW.data.loadAsync(lambda asset, error: self.onAssetLoaded(assetW, sectionW, error), False)
+
+    def onAssetLoaded(self, assetW, sectionW, error):
+        """called when an asset was loaded in the background: replace the placeholder with the control"""
+        assetW.isLoading = False
+        if not error:
+            assetW.showControl()
+            if self.isStreaming(sectionW.data):                             # user could have switched groups or collapsed the section while loading
+                assetW.data.subscribe()
+        elif isinstance(error, IOT.AssetNotFoundException):
+            if assetW.data in sectionW.data.assets:
+                sectionW.data.assets.remove(assetW.data)
+            sectionW.assets.remove_widget(assetW)
+            showError(error, ", removing asset from dashboard")
+        else:
+            assetW.setControl(InvalidControlWidget())
+            assetW.isMaterialized = True                                    # nothing more to load, don't try again when scrolling
+            showError(error, ", asset not loaded")
+
     def setSelectedGroup(self, group):
         """switch selected group and render the content"""
         logging.info("changing selected group")
         if self.selectedGroup:
             self.selectedGroup.toggleSelected()
+            self.scheduleRelease(self.selectedGroup.data)
         self.selectedGroup = group
         if self.selectedGroup:
             self.selectedGroup.toggleSelected()
+            self.cancelRelease(group.data)
             self.loadSections()
+            self.activateGroup(group.data)
         else:
             self.workspace.clear_widgets()              # no group, then workspace is completely empty
 
+    def activateGroup(self, group):
+        """start streaming the values of the loaded assets in the expanded sections of the group and bring the ones
+        that weren't streaming up to date. Assets that still need to be loaded are subscribed when their load is done."""
+        assets = []
+        for section in group.sections:
+            if section.isExpanded:
+                assets.extend(section.assets)
+        self.activateAssets(assets)
+
+    def activateAssets(self, assets):
+        if self.isConnecting:                                       # done when the connection is made
+            return
+        ids = set()
+        for asset in assets:
+            if asset.isLoaded and not asset.isSubscribed:
+                asset.subscribe()
+                ids.add(asset.id)
+        if ids:
+            IOT.refreshStates(ids)
+
+    def isStreaming(self, section):
+        """true if the values of the assets in the section are monitored: it's expanded and the group is visible or
+        was closed only recently"""
+        group = section.parent
+        return section.isExpanded and ((self.selectedGroup and self.selectedGroup.data is group) or group in self._pendingReleases)
+
+    def scheduleRelease(self, group):
+        """stop streaming the assets of the group after the grace period"""
+        self.cancelRelease(group)
+        self._pendingReleases[group] = Clock.schedule_once(lambda delta: self.releaseGroup(group), subscriptionGracePeriod)
+
+    def cancelRelease(self, group):
+        event = self._pendingReleases.pop(group, None)
+        if event:
+            event.cancel()
+
+    def releaseGroup(self, group):
+        """stop streaming the values of the assets in the group. Assets that are also shown in another
+        group that is still visible keep streaming (the record only unsubscribes when it has no more views)."""
+        self._pendingReleases.pop(group, None)
+        if self.selectedGroup and self.selectedGroup.data is group:
+            return
+        for section in group.sections:
+            for asset in section.assets:
+                asset.unsubscribe()
+
     def loadSections(self):
-        """loads the sections of the currently selected group in the workspace"""
+        """loads the sections of the currently selected group in the workspace.
+        When the group was shown recently, the widgets that were built back then are reused (the values
+        are kept up to date through the subscriptions)."""
+        self._removeDecorations(self._workspaceDecorations)
         self.workspace.clear_widgets()
         self.selectedItems.clear()                                  # not yet supported to remember selection after page switch
         if self.selectedGroup:
-            for section in self.selectedGroup.data.sections:
-                sectionW = SectionWidget(section)
-                sectionW.sectionWidth = self.sectionWidth
+            group = self.selectedGroup.data
+            sections = None
+            if not self.isEditing:                                  # edit mode adds buttons to the widgets, so those don't get cached.
+                sections = self._workspaceCache.pop(group, None)
+            if sections is None:
+                sections = self.buildSections(group)
+            for sectionW in sections:
+                sectionW.sectionWidth = self.sectionWidth           # screen could have been resized while not shown
                 self.workspace.add_widget(sectionW)
-                toRemove = []
-                for asset in section.assets:
-                    try:
-                        if asset.isLoaded == False:
-                            asset.load()
-                        self.addAssetToSection(asset, sectionW)
-                    except IOT.AssetNotFoundException as e:
-                        toRemove.append(asset)
-                        logging.exception("failed to load asset")
-                        showError(e, ", removing asset from dashboard")
-                    except IOT.Exception as exc:
-                        logging.exception("failed to load asset")
-                        showError(exc, ", asset not loaded")
-                for item in toRemove: section.assets.remove(item)
+            self.getViewport().refresh()
             if self.isEditing:
                 self.editWorkSpace()
+            else:
+                self._workspaceCache[group] = sections
+                while len(self._workspaceCache) > workspaceCacheSize:
+                    self._workspaceCache.popitem(last=False)
+
+    def buildSections(self, group):
+        """create the widgets for all the sections in the group. Collapsed sections only get their asset widgets
+        when they are expanded."""
+        result = []
+        for section in group.sections:
+            sectionW = SectionWidget(section)
+            result.append(sectionW)
+            if sectionW.isExpanded:
+                self.populateSection(sectionW)
+            sectionW.bind(isExpanded=self.onSectionExpanded)
+        return result
+
+    def populateSection(self, sectionW):
+        """create the asset widgets of the section"""
+        sectionW.isPopulated = True
+        if self.isEditing:
+            self.addAddTo(sectionW.assets, self.newAsset, sectionW)     # first, assets are inserted in front of it
+        for asset in sectionW.data.assets:
+            assetW = self.addAssetToSection(asset, sectionW)
+            if self.isEditing:
+                self.addEditTo(assetW, 20)
+
+    def onSectionExpanded(self, sectionW, value):
+        """the user collapsed or expanded a section: create or remove the asset widgets and start or stop streaming"""
+        if value:
+            if not sectionW.isPopulated:
+                self.populateSection(sectionW)
+            self.activateAssets(sectionW.data.assets)
+        else:
+            for assetW in sectionW.assets.children:
+                self.selectedItems.difference_update(assetW.children)   # the edit buttons of the removed assets
+            sectionW.assets.clear_widgets()
+            sectionW.isPopulated = False
+            for asset in sectionW.data.assets:
+                asset.unsubscribe()
 
     def _clearUI(self):
         """clears out the current ui elements"""
@@ -284,8 +484,16 @@ class MainWindow(Widget):
         if self.isEditing:
             self.endEdit()
         dt.save()                     # first save the current layout, so we don't loose current data
+        for group in self._pendingReleases.keys():
+            self.cancelRelease(group)
+        reconnector.stop()                                          # could still be trying to make the first connection for the previous layout
+        self.isConnecting = False
+        self._waitingForConnection = []
+        self._workspaceCache.clear()
+        prefetcher.stop()
         self._clearUI()
         IOT.disconnect(False)           # new layout, so close connection to previous
+        layout.clearRecords()           # the subscriptions are gone, so the records can't be reused.
 
     def newLayout(self, popup):
         """create a new layout"""
@@ -320,7 +528,7 @@ class MainWindow(Widget):
         btn.height = '100dp'
         btn.text_size = btn.size
         btn.bind(on_press=self.setCredentialsNew)
-        self.workspace.add_widget(btn)
+        self._decorate(self.workspace, btn)
 
     def setCredentialsNew(self, sender):
         """set the credentials for a new layout (first time credentials are set)"""
@@ -341,20 +549,40 @@ class MainWindow(Widget):
         try:
             if not forNewLayout:                                    # if we were already connected, reconnect.
                 IOT.disconnect(False)
+            IOT.setCommandTransport(dt.data.commandTransport)
             IOT.connect(dt.data.userName, dt.data.password, dt.data.server, dt.data.broker)     # connect with the new credentials
+            if not forNewLayout:
+                layout.resubscribeRecords()                         # the disconnect removed all the subscriptions.
             if forNewLayout:                                        # if it was a new layout, there was a button on the workspace to set the credentials, this can be removed now.
                 self.workspace.remove_widget(self.workspace.children[0])
         except Exception as e:
             showError(e)
 
 
+    def _decorate(self, parent, widget, **bindings):
+        """add an edit widget to the parent and remember it (and the bindings with the parent), so that endEdit can remove it again"""
+        if bindings:
+            parent.bind(**bindings)
+        parent.add_widget(widget)
+        if parent.parent is self.menu:
+            self._menuDecorations.append((parent, widget, bindings))
+        else:
+            self._workspaceDecorations.append((parent, widget, bindings))
+
+    def _removeDecorations(self, decorations):
+        for parent, widget, bindings in decorations:
+            if bindings:
+                parent.unbind(**bindings)
+            if widget.parent is parent:
+                parent.remove_widget(widget)
+        del decorations[:]
+
     def addEditTo(self, addTo, offset):
         edit = EditButton()
         edit.offset = offset
         edit.reposition(addTo, None)
-        addTo.bind(size=edit.reposition, pos=edit.reposition)
         edit.bind(state=self.toggleEdit)
-        addTo.add_widget(edit)
+        self._decorate(addTo, edit, size=edit.reposition, pos=edit.reposition)
 
     def toggleEdit(self, instance, value):
         if value == 'down':
@@ -367,7 +595,7 @@ class MainWindow(Widget):
     def addAddTo(self, addTo ,callback = None, section = None):
         add = EditButton()
         add.text = '[size=30]%s[/size]'%(iconfonts.icon('fa-plus'))
-        addTo.add_widget(add)
+        self._decorate(addTo, add)
         if section:
             add.section = section       #provide ref to section which will become the parent of the asset
         if callback:
@@ -380,6 +608,7 @@ class MainWindow(Widget):
                 popup.dismiss()
             if not self.isEditing:                                              # don't edit again if already editing.
                 self.isEditing = True
+                self._workspaceCache.clear()                                    # the layout can change while editing, so don't reuse old widgets.
                 self.editActionBar = EditActionBar()                            # add this before any selectionbox, otherewise they are located incorrectly
                 self.editActionBar.title = self.data.title
                 self.rootLayout.add_widget(self.editActionBar, len(self.rootLayout.children))
@@ -388,23 +617,24 @@ class MainWindow(Widget):
                     if not group == self.menu.children[0]:
                         edit.x = group.x + group.width - kivy.metrics.dp(20)
                         edit.bind(state=self.toggleEdit)
-                        group.bind(size=edit.reposition, pos=edit.reposition)
+                        bindings = {'size': edit.reposition, 'pos': edit.reposition}
                     else:
                         edit.text = '[size=30]%s[/size]'%(iconfonts.icon('fa-plus'))
                         edit.x = group.x
                         edit.bind(state=self.newGroup)
-                        group.bind(size=edit.repositionAdd, pos=edit.repositionAdd)
+                        bindings = {'size': edit.repositionAdd, 'pos': edit.repositionAdd}
                     edit.y = group.y + group.height - kivy.metrics.dp(20)
-                    group.add_widget(edit)
+                    self._decorate(group, edit, **bindings)
                 self.editWorkSpace()
         except Exception as e:
             showError(e)
 
     def editWorkSpace(self):
-        if self.selectedGroup:                                      # we can only add a new section if there is a group selected.
+        """add the edit buttons to the sections and assets of the workspace, endEdit removes them again."""
+        if self.selectedGroup:                                     # we can only add a new section if there is a group selected.
             for section in self.workspace.children:
                 self.addEditTo(section, 30)
-                if hasattr(section, 'assets'):
+                if hasattr(section, 'assets') and section.isPopulated:   # collapsed sections get decorated when expanded
                     for asset in section.assets.children:
                         self.addEditTo(asset, 20)
                     self.addAddTo(section.assets, self.newAsset, section)
@@ -413,12 +643,15 @@ class MainWindow(Widget):
             self.addSetCredentialsBtnNew()
 
     def endEdit(self):
-        """stop the current edit session, remove all the edit and add widgets"""
+        """stop the current edit session, remove all the edit and add widgets. The rest of the ui stays as it is."""
         self.isEditing = False
         self.rootLayout.remove_widget(self.editActionBar)       # do this first, so that location of the rest is faster/correcter
-        self.loadMenu()                 #reload the menu to remove the selection boxes
-        self.loadSections()             #reloading the sections will first clear out all the old stuff
+        self._removeDecorations(self._menuDecorations)
+        self._removeDecorations(self._workspaceDecorations)
+        self.selectedItems.clear()
         self.editActionBar = None
+        if self.selectedGroup:
+            self._workspaceCache[self.selectedGroup.data] = [x for x in self.workspace.children if isinstance(x, SectionWidget)][::-1]
 
     def editSelected(self):
         """for each selected item, show an editor"""
@@ -427,7 +660,7 @@ class MainWindow(Widget):
             if type(parent) == GroupMenuItem:
                 self.editGroup(parent.data)
             elif type(parent) == SectionWidget:
-                self.editSection(parent.data)
+                self.editSection(parent.data, parent)
             elif type(parent) == AssetWidget:
                 self.editAsset(parent.data, parent)
 
@@ -471,16 +704,17 @@ appConfigFileName = 'app.config'
 server = 'none'
 broker = None
 
-def tryReconnect(clockData):
-    """callback function for the timer object that is triggered when an iot.reconnect failed when the app resumes."""
-    try:
-        if dt.data:  # can get called multiple times, sometimes no memory objects are set
+def reconnect():
+    """re-establish the network connections after the app resumed. Called by the ReconnectManager on a background thread."""
+    if dt.data:  # can get called multiple times, sometimes no memory objects are set
+        if IOT.isLoggedIn():
             IOT.reconnect(dt.data.server, dt.data.broker)
             logging.info("reconnected after resume")
-            closeReconnectError()               # if the operation was succesul, don't need to show the error message anymore (if there was any)
-    except Exception as e:
-        Clock.schedule_once(tryReconnect, 1)
-        showReconnectError(str(e))
+        else:                                                       # the connect at startup failed, there are no tokens to resume with.
+            IOT.connect(dt.data.userName, dt.data.password, dt.data.server, dt.data.broker)
+            logging.info("connected")
+
+reconnector = ReconnectManager(reconnect)
 
 class attDashApp(App):
 
@@ -491,6 +725,7 @@ class attDashApp(App):
     def build(self):
         if not os.path.isdir(self.get_dataPath()):          # make certain taht the dir exists to save layout-boards.
             os.makedirs(self.get_dataPath())
+        IOT.setCacheFile(os.path.join(self.get_dataPath(), 'metadata.cache'))     # warm start: asset definitions that didn't change don't have to be fetched again.
         self._main = MainWindow()
         dt.config = ConfigParser()
         if dt.config.read(appConfigFileName) and dt.config.has_option('general', 'layout'):
@@ -514,11 +749,12 @@ class attDashApp(App):
             logging.exception('failed to save application state')
 
     def on_pause(self):                         # can get called multiple times, sometimes no memory objects are set
+        reconnector.stop()
         self.saveState(True)
         return True
 
     def on_resume(self):
-        tryReconnect(None)
+        reconnector.start()
 
     # todo: remove this when profiling is done
     #def on_start(self):
@@ -547,5 +783,5 @@ iconfonts.register('default_font', 'iconfonts/fontawesome-webfont.ttf', 'iconfon
 Application = attDashApp()
 
 if __name__ == '__main__':
-    sm.loadSkins('skins')
+    sm.loadSkins('skins', os.path.join(Application.user_data_dir, 'skins.index'))
     Application.run()
\ No newline at end of file
@@ -0,0 +1,170 @@
+__author__ = 'Jan Bogaerts'
+__copyright__ = "Copyright 2016, AllThingsTalk"
+__credits__ = []
+__maintainer__ = "Jan Bogaerts"
+__email__ = "jb@allthingstalk.com"
+__status__ = "Prototype"  # "Development", or "Production"
+
+# shows numbers that change often without rendering a new text texture for every value: the digits, sign, decimal
+# point, ... are rendered once per font size in a single texture, a value is composed of rectangles that each show
+# a region of that texture. Changing the value only changes the texture coordinates and positions of those rectangles.
+
+from kivy.uix.widget import Widget
+from kivy.properties import StringProperty, NumericProperty, BooleanProperty, ListProperty
+from kivy.graphics import Color, Rectangle, InstructionGroup
+from kivy.core.text import Label as CoreLabel
+
+_chars = u'0123456789+-.,:%eE '                        # everything that's needed to show a number
+_atlases = {}                                           # (font size, bold) -> GlyphAtlas
+_textures = {}                                          # (text, font size, bold) -> texture, for the units
+
+
+def renderText(text, fontSize, bold = False, cache = True):
+    """get the texture of a text that is not made of glyphs.
+    :param cache: true for texts that don't change often, like a unit, their textures are shared. Other values
+                  are rendered each time, otherwise the cache would keep on growing."""
+    key = (text, fontSize, bold)
+    texture = _textures.get(key) if cache else None
+    if texture is None:
+        label = CoreLabel(text=text, font_size=fontSize, bold=bold)
+        label.refresh()
+        texture = label.texture
+        if cache:
+            _textures[key] = texture
+    return texture
+
+def getAtlas(fontSize, bold = False):
+    """get the glyphs for the font size, they are shared by all the widgets"""
+    key = (int(round(fontSize)), bold)
+    result = _atlases.get(key)
+    if result is None:
+        result = GlyphAtlas(key[0], bold)
+        _atlases[key] = result
+    return result
+
+
+class GlyphAtlas(object):
+    """all the characters that are needed for showing a number, rendered in a single texture."""
+    def __init__(self, fontSize, bold):
+        label = CoreLabel(text=_chars, font_size=fontSize, bold=bold)
+        label.refresh()
+        self.texture = label.texture
+        self.height = self.texture.height
+        self.glyphs = {}                                            # char -> (region of the texture, width)
+        start = 0
+        for i, char in enumerate(_chars):
+            end = label.get_extents(_chars[:i + 1])[0]
+            self.glyphs[char] = (self.texture.get_region(start, 0, end - start, self.height), end - start)
+            start = end
+
+
+class GlyphText(InstructionGroup):
+    """
+    the canvas instructions that draw a text with the glyphs of an atlas. Rectangles are reused between values.
+    A text that contains characters that aren't in the atlas is rendered as a whole (slow, but correct).
+    """
+    def __init__(self, fontSize, bold = False, **kwargs):
+        super(GlyphText, self).__init__(**kwargs)
+        self.atlas = getAtlas(fontSize, bold)
+        self.fontSize = fontSize
+        self.bold = bold
+        self.text = None
+        self.x = 0
+        self.y = 0
+        self.width = 0
+        self.height = self.atlas.height
+        self._rects = []
+        self._offsets = []
+
+    def setText(self, text):
+        if text == self.text:
+            return
+        self.text = text
+        glyphs = self.atlas.glyphs
+        if all(char in glyphs for char in text):
+            items = [glyphs[char] for char in text]
+        else:
+            texture = renderText(text, self.fontSize, self.bold, False)
+            items = [(texture, texture.width)]
+        while len(self._rects) < len(items):
+            rect = Rectangle(size=(0, 0))
+            self.add(rect)
+            self._rects.append(rect)
+        offset = 0
+        self._offsets = []
+        for i, rect in enumerate(self._rects):
+            if i < len(items):
+                texture, width = items[i]
+                rect.texture = texture
+                rect.size = (width, texture.height)
+                self._offsets.append(offset)
+                offset += width
+            else:
+                rect.size = (0, 0)                                  # not needed for this value, keep it for longer ones.
+        self.width = offset
+        self._place()
+
+    def setPos(self, x, y):
+        self.x = x
+        self.y = y
+        self._place()
+
+    def _place(self):
+        for rect, offset in zip(self._rects, self._offsets):
+            rect.pos = (self.x + offset, self.y)
+
+
+class NumericLabel(Widget):
+    """a label for numbers that change often, see the top of the module. Other texts are shown as well, but slower.
+    Like a Label, the widget doesn't resize itself, bind to texture_size for that."""
+    text = StringProperty('')
+    unit = StringProperty('')                               # shown after the value
+    font_size = NumericProperty('15sp')
+    bold = BooleanProperty(False)
+    color = ListProperty([1, 1, 1, 1])
+    texture_size = ListProperty([0, 0])                     # the size of the content
+
+    def __init__(self, **kwargs):
+        self._glyphs = None
+        self._unit = None
+        super(NumericLabel, self).__init__(**kwargs)
+        with self.canvas:
+            self._color = Color(*self.color)
+        self._createText()
+        self.bind(text=self._update, unit=self._update, pos=self._place, size=self._place,
+                  font_size=self._createText, bold=self._createText, color=self._setColor)
+
+    def _setColor(self, instance, value):
+        self._color.rgba = value
+
+    def _createText(self, *args):
+        """the font changed, so other glyphs are needed"""
+        if self._glyphs:
+            self.canvas.remove(self._glyphs)
+            self.canvas.remove(self._unit)
+        self._glyphs = GlyphText(self.font_size, self.bold)
+        self._unit = Rectangle(size=(0, 0))
+        self.canvas.add(self._glyphs)
+        self.canvas.add(self._unit)
+        self._update()
+
+    def _update(self, *args):
+        self._glyphs.setText(self.text)
+        width = self._glyphs.width
+        height = self._glyphs.height
+        if self.unit:
+            texture = renderText(u' ' + self.unit, self.font_size, self.bold)
+            self._unit.texture = texture
+            self._unit.size = texture.size
+            width += texture.width
+            height = max(height, texture.height)
+        else:
+            self._unit.size = (0, 0)
+        self.texture_size = [width, height]
+        self._place()
+
+    def _place(self, *args):
+        x = int(self.center_x - self.texture_size[0] / 2.0)
+        y = int(self.center_y - self.texture_size[1] / 2.0)
+        self._glyphs.setPos(x, y)
+        self._unit.pos = (x + self._glyphs.width, y)
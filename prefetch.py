@@ -0,0 +1,75 @@
+__author__ = 'Jan Bogaerts'
+__copyright__ = "Copyright 2016, AllThingsTalk"
+__credits__ = []
+__maintainer__ = "Jan Bogaerts"
+__email__ = "jb@allthingstalk.com"
+__status__ = "Prototype"  # "Development", or "Production"
+
+# loads the assets of the groups that are not shown in the background, after the first screen is ready, so that
+# switching to another group doesn't have to wait for the cloud.
+
+import time
+import logging
+from kivy.clock import mainthread
+
+import attiotuserclient as IOT
+from workers import WorkerPool
+
+
+class Prefetcher(object):
+    """
+    fetches the definitions of the assets in the groups that are not selected, one at a time with a pause in between,
+    so that it doesn't compete with what the user is doing. Loading an asset also preloads the images of it's skin.
+    """
+
+    def __init__(self, interval = 0.25, maxAssets = 500):
+        """
+        :param interval: nr of seconds to wait between 2 requests.
+        :param maxAssets: the maximum nr of assets that are prefetched.
+        """
+        self.interval = interval
+        self.maxAssets = maxAssets
+        self._worker = WorkerPool(1, 'prefetch')
+        self._generation = 0                                        # incremented when stopped, so that running jobs know they have to quit.
+
+    def start(self, groups):
+        """prefetch the assets of all the groups that are not selected"""
+        self.stop()
+        assets = []
+        ids = set()
+        for group in groups:
+            if not group.isSelected:
+                for section in group.sections:
+                    for asset in section.assets:
+                        if not asset.isLoaded and asset.id and asset.id not in ids:
+                            ids.add(asset.id)
+                            assets.append(asset)
+        if assets:
+            logging.info("prefetching " + str(min(len(assets), self.maxAssets)) + " assets")
+            self._worker.submit(self._fetch, (self._generation, assets[:self.maxAssets]))
+
+    def stop(self):
+        """stop prefetching (a new layout gets loaded)"""
+        self._generation += 1
+
+    def _fetch(self, generation, assets):
+        """called on the worker thread"""
+        for asset in assets:
+            if generation != self._generation:
+                return
+            try:
+                data = IOT.getAsset(asset.id)                       # also puts it in the metadata cache
+                if data:
+                    self._fetched(generation, asset, data)
+            except Exception as e:
+                logging.info("failed to prefetch asset {}: {}".format(asset.id, e))
+            time.sleep(self.interval)
+
+    @mainthread
+    def _fetched(self, generation, asset, data):
+        if generation != self._generation or asset.isLoaded:       # could have been loaded by the user in the mean time
+            return
+        try:
+            asset.loadFromData(data, False)                         # the group isn't visible, so don't stream the values yet
+        except:
+            logging.exception("failed to prefetch asset")
@@ -0,0 +1,120 @@
+__author__ = 'Jan Bogaerts'
+__copyright__ = "Copyright 2016, AllThingsTalk"
+__credits__ = []
+__maintainer__ = "Jan Bogaerts"
+__email__ = "jb@allthingstalk.com"
+__status__ = "Prototype"  # "Development", or "Production"
+
+import logging
+import random
+import time
+from kivy.event import EventDispatcher
+from kivy.properties import StringProperty, NumericProperty
+from kivy.clock import Clock, mainthread
+
+from workers import WorkerPool
+from errors import *
+
+try:
+    from android.broadcast import BroadcastReceiver         # only available on android, used to get notified when the network comes back.
+except:
+    BroadcastReceiver = None
+
+
+class ReconnectManager(EventDispatcher):
+    """
+    restores the connection with the cloud after the app resumed or the network went down.
+    Failed attempts are retried with an exponentially growing delay (with some random jitter, so that a lot of
+    devices don't all retry at the same time), up to 'maxDelay'. When the os reports that the network is available
+    again, the next attempt is done right away.
+    The ui can bind to 'state' and 'nextAttempt' to show what's going on.
+    """
+    state = StringProperty('connected')                     # 'connected', 'connecting', 'waiting' (for the next attempt) or 'stopped'
+    nextAttempt = NumericProperty(0)                        # epoch time of the next attempt, 0 when none is planned.
+    attempts = NumericProperty(0)                           # nr of attempts that failed since the last succesful connection.
+
+    def __init__(self, connect, minDelay = 1, maxDelay = 300, **kwargs):
+        """
+        :param connect: function that does the actual (re)connect. Should raise an exception when it failed. Is called on a background thread.
+        """
+        self._connect = connect
+        self.minDelay = minDelay
+        self.maxDelay = maxDelay
+        self._event = None
+        self._worker = WorkerPool(1, 'reconnect')
+        self._receiver = None
+        super(ReconnectManager, self).__init__(**kwargs)
+
+    def start(self):
+        """try to reconnect now, and keep on trying until it works"""
+        if self.state != 'connecting':
+            self._cancelEvent()
+            self.attempts = 0
+            self._startNetworkMonitor()
+            self._attempt()
+
+    def stop(self):
+        """stop trying (the app is going to sleep)"""
+        self._cancelEvent()
+        self._stopNetworkMonitor()
+        self.nextAttempt = 0
+        if self.state != 'connected':
+            self.state = 'stopped'
+
+    def networkAvailable(self):
+        """call this when the network came back, so we don't have to wait until the next planned attempt"""
+        if self.state == 'waiting':
+            logging.info("network available, reconnecting")
+            self._cancelEvent()
+            self._attempt()
+
+    def _attempt(self, dt = None):
+        self._event = None
+        self.nextAttempt = 0
+        self.state = 'connecting'
+        self._worker.submit(self._connect, (), lambda result: self._attemptDone(None), self._attemptDone)
+
+    @mainthread
+    def _attemptDone(self, error):
+        if self.state != 'connecting':                     # we got stopped while connecting
+            return
+        if not error:
+            logging.info("reconnected after " + str(self.attempts + 1) + " attempt(s)")
+            self.attempts = 0
+            self.state = 'connected'
+            self._stopNetworkMonitor()
+            closeReconnectError()                           # if the operation was succesul, don't need to show the error message anymore (if there was any)
+        else:
+            self.attempts += 1
+            delay = min(self.maxDelay, self.minDelay * 2 ** self.attempts)
+            delay = random.uniform(delay / 2.0, delay)      # jitter
+            self.nextAttempt = time.time() + delay
+            self.state = 'waiting'
+            self._event = Clock.schedule_once(self._attempt, delay)
+            logging.info("reconnect failed, next attempt in {:.1f} sec".format(delay))
+            showReconnectError("{} (next attempt in {:.0f} sec)".format(error, delay))
+
+    def _cancelEvent(self):
+        if self._event:
+            self._event.cancel()
+            self._event = None
+
+    def _startNetworkMonitor(self):
+        if BroadcastReceiver and not self._receiver:
+            try:
+                self._receiver = BroadcastReceiver(self._onBroadcast, actions=['android.net.conn.CONNECTIVITY_CHANGE'])
+                self._receiver.start()
+            except:
+                self._receiver = None
+                logging.exception("failed to monitor the network state")
+
+    def _stopNetworkMonitor(self):
+        if self._receiver:
+            self._receiver.stop()
+            self._receiver = None
+
+    @mainthread
+    def _onBroadcast(self, context, intent):
+        """called by android when the network state changed"""
+        if not intent.getBooleanExtra('noConnectivity', False):
+            self.networkAvailable()
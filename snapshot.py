@@ -0,0 +1,50 @@
+__author__ = 'Jan Bogaerts'
+__copyright__ = "Copyright 2016, AllThingsTalk"
+__credits__ = []
+__maintainer__ = "Jan Bogaerts"
+__email__ = "jb@allthingstalk.com"
+__status__ = "Prototype"  # "Development", or "Production"
+
+# stores the last known state of all the loaded assets of a layout next to the .board file, so that at the next
+# startup, the selected group can be rendered before there is a connection with the cloud.
+
+import os
+import json
+import logging
+
+
+def getFileName(boardFile):
+    return os.path.splitext(boardFile)[0] + '.snapshot'
+
+def save(boardFile, layout):
+    """write the definition and last value of every loaded asset in the layout to disk"""
+    assets = {}
+    for group in layout.groups:
+        for section in group.sections:
+            for asset in section.assets:
+                if asset.isLoaded and asset.id not in assets:
+                    data = asset.record.getData()
+                    assets[asset.id] = {'title': data['title'], 'is': data['is'], 'profile': data['profile'],
+                                        'control': data['control'], 'state': data['state']}
+    with open(getFileName(boardFile), 'w') as f:
+        json.dump({'version': 1.0, 'assets': assets}, f)
+
+def restore(boardFile, layout):
+    """load the assets of the selected group from the snapshot (if there is one).
+    returns the list of assets that were restored."""
+    fileName = getFileName(boardFile)
+    result = []
+    if os.path.isfile(fileName):
+        try:
+            with open(fileName) as f:
+                assets = json.load(f)['assets']
+            for group in layout.groups:
+                if group.isSelected:
+                    for section in group.sections:
+                        for asset in section.assets:
+                            if asset.id in assets:
+                                asset.loadFromData(assets[asset.id], False, True)      # only part of the definition, so it's fetched again when needed
+                                result.append(asset)
+        except:
+            logging.exception("failed to restore snapshot")
+    return result
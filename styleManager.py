@@ -8,51 +8,210 @@ __status__ = "Prototype"  # "Development", or "Production"
 import os
 import json
 import re
+import logging
 from kivy.properties import dpi2px
 
 
-skinTypes = {}                  # dictionary of all skin types. value is dictionary of skin names + skin
+skinTypes = {}                  # dictionary of all skin types. value is dictionary of skin names + skin. A type is only added when it's first used.
+_skinsPath = None               # the directory that contains the skins
+_skinNames = {}                 # control type -> list of skin names, from the index
+atlasName = 'skin'              # name of the texture atlas in a skin directory (made by buildatlas.py)
+_styles = {}                    # (control type, skin name, asset overrides) -> ResolvedStyle
+_generation = 0                 # incremented when the skins are reloaded, so that the styles remembered by the assets are resolved again.
+_metricPattern = re.compile(r"([0-9]+)([a-z]+)", re.I)
+_ignoredOverrides = ('title', 'control')       # values in the skin of an asset that don't change the look of the control
+_imageExtensions = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
 
-def loadSkins(path):
-    """load all the available skins from disk"""
-    global skinTypes
+def loadSkins(path, indexFile = None):
+    """find all the available skins on disk. The definitions of the skins are only loaded when a control type is first used.
+    :param indexFile: when specified, the list of skins is stored in this file, so that at the next startup, it only
+                      has to be checked that the skin directories didn't change."""
+    global skinTypes, _skinsPath, _skinNames, _generation
     skinTypes = {}                                  # clear any prev values.
-    for root, dirs, files in os.walk(path):
-        for dir in dirs:
-            skins = {}
-            skinTypes[dir] = skins
-            for root2, dirs2, files2 in os.walk(os.path.join(root, dir)):
-                for skinName in dirs2:
-                    with open(os.path.join(root2, skinName, 'definition.json')) as data_file:
-                        skin = json.load(data_file)
-                        skin['path'] = os.path.join(root2, skinName)
-                        skin['name'] = skinName
-                        skins[skinName] = skin
+    _styles.clear()
+    _generation += 1
+    _skinsPath = path
+    _skinNames = None
+    if indexFile:
+        _skinNames = _readIndex(path, indexFile)
+    if _skinNames is None:
+        _skinNames = _buildIndex(path)
+        if indexFile:
+            _writeIndex(path, indexFile, _skinNames)
+
+def _buildIndex(path):
+    """list the skins of every control type: the sub directories that contain a definition"""
+    result = {}
+    for type in os.listdir(path):
+        typePath = os.path.join(path, type)
+        if os.path.isdir(typePath):
+            result[type] = [name for name in os.listdir(typePath) if os.path.isfile(os.path.join(typePath, name, 'definition.json'))]
+    return result
+
+def _getModificationTimes(path, types):
+    """adding or removing a control type or skin changes the modification time of the directory it is in"""
+    result = {'': os.path.getmtime(path)}
+    for type in types:
+        result[type] = os.path.getmtime(os.path.join(path, type))
+    return result
+
+def _readIndex(path, indexFile):
+    """get the skin names from the index file. Returns None if there is no index or if the skins changed since it was made."""
+    try:
+        with open(indexFile) as data_file:
+            index = json.load(data_file)
+        if index['path'] == os.path.abspath(path) and index['mtimes'] == _getModificationTimes(path, index['skins'].keys()):
+            return index['skins']
+    except (IOError, OSError, ValueError, KeyError):
+        pass
+    return None
+
+def _writeIndex(path, indexFile, skinNames):
+    try:
+        with open(indexFile, 'w') as f:
+            json.dump({'path': os.path.abspath(path), 'mtimes': _getModificationTimes(path, skinNames.keys()), 'skins': skinNames}, f)
+    except (IOError, OSError):
+        logging.exception("failed to save the skin index")
+
+def _getSkins(type):
+    """get the skins of the control type, the definitions are loaded the first time that the type is used.
+    Returns None if there are no skins for the type."""
+    skins = skinTypes.get(type)
+    if skins is None and type in _skinNames:
+        skins = {}
+        for skinName in _skinNames[type]:
+            skinPath = os.path.join(_skinsPath, type, skinName)
+            with open(os.path.join(skinPath, 'definition.json')) as data_file:
+                skin = json.load(data_file)
+                skin['path'] = skinPath
+                skin['name'] = skinName
+                skins[skinName] = skin
+            atlasFile = os.path.join(skinPath, atlasName + '.atlas')
+            if os.path.isfile(atlasFile):
+                skin['atlas'] = _readAtlasIds(atlasFile)
+        skinTypes[type] = skins
+    return skins
+
+def _readAtlasIds(atlasFile):
+    """get the names of all the images in the atlas"""
+    with open(atlasFile) as data_file:
+        pages = json.load(data_file)
+    result = set()
+    for ids in pages.itervalues():
+        result.update(ids.keys())
+    return result
+
+def _isImage(skin, value):
+    """some skins refer to images without the extension"""
+    if value.lower().endswith(_imageExtensions):
+        return True
+    atlas = skin.get('atlas')
+    return bool(atlas) and value in atlas
+
+def getImage(skin, name):
+    """get the source of an image of the skin: the region in the atlas of the skin if there is one, otherwise the file.
+    All the controls that use the same skin then share 1 texture."""
+    value = skin[name]
+    atlas = skin.get('atlas')
+    if atlas:
+        id = os.path.splitext(value)[0]
+        if id in atlas:
+            return 'atlas://' + skin['path'] + '/' + atlasName + '/' + id
+    return os.path.join(skin['path'], value)
 
 
 def getAvailableSkins(type):
-    skins = skinTypes[type]
+    skins = _getSkins(type)
+    if not skins:
+        return []
     return [value for name, value in skins.iteritems()]
 
 def getSkin(type, asset):
     """get the skin for the specified control type and state.
     The asset can overwrite default values"""
-    if type in skinTypes:
-        skins = skinTypes[type]
-        if skins:
-            if asset and asset.skin and "name" in asset.skin:
-                key = asset.skin["name"]
-                if key in skins:
-                    return skins[key]
-            if 'default' in skins:
-                return skins["default"]
-            if len(skins) > 0:            #the name is not known and no 'default' found, so return the first skin.
-                    return skins.itervalues().next()
+    skins = _getSkins(type)
+    if skins:
+        if asset and asset.skin and "name" in asset.skin:
+            key = asset.skin["name"]
+            if key in skins:
+                return skins[key]
+        if 'default' in skins:
+            return skins["default"]
+        if len(skins) > 0:            #the name is not known and no 'default' found, so return the first skin.
+                return skins.itervalues().next()
+
+class ResolvedStyle(object):
+    """
+    a skin with the overrides of an asset applied to it, so that building a control doesn't have to look up
+    every value in 2 dictionaries and parse the sizes again. Use getStyle to get one, they are shared.
+    """
+    def __init__(self, type, skin, overrides):
+        self.type = type
+        self.skin = skin
+        self.generation = _generation
+        self.values = dict(skin) if skin else {}
+        if overrides:
+            self.values.update(overrides)
+        self.size = _getControlSize(skin, overrides)               # in pixels
+        self._files = {}
+        self._ranges = {}                                           # (data type, minimum, maximum, value) -> (min, max, step)
+
+    def get(self, name, default = None):
+        """same as getVar"""
+        return self.values.get(name, default)
+
+    def getImages(self):
+        """the sources of all the images that the control uses"""
+        if not self.skin:
+            return []
+        return [self.getFile(key) for key, value in self.skin.iteritems()
+                if key not in ('example', 'path', 'name', 'atlas') and isinstance(value, basestring) and _isImage(self.skin, value)]
+
+    def getFile(self, name):
+        """the source of an image of the skin, see getImage"""
+        result = self._files.get(name)
+        if result is None:
+            result = getImage(self.skin, name)
+            self._files[name] = result
+        return result
+
+    def getRange(self, value, typeInfo):
+        """(minimum, maximum, step) of the control for an asset with the specified profile, see getMinimum, getMaximum, getStep.
+        The value only matters when the profile doesn't define the minimum or maximum."""
+        bounded = 'minimum' in typeInfo and 'maximum' in typeInfo
+        key = (typeInfo.get('type'), typeInfo.get('minimum'), typeInfo.get('maximum'), None if bounded else value)
+        result = self._ranges.get(key)
+        if result is None:
+            if len(self._ranges) > 100:                             # unbounded profiles add a key per value
+                self._ranges.clear()
+            result = (getMinimum(self.type, value, typeInfo), getMaximum(self.type, value, typeInfo), getStep(self.type, typeInfo))
+            self._ranges[key] = result
+        return result
+
+def getStyle(type, asset):
+    """get the resolved skin for the specified control type and asset. The result is remembered by the asset until
+    it changes it's skin settings (Asset.skinChanged) or the skins are reloaded."""
+    if asset:
+        result = asset.styles.get(type)
+        if result is not None and result.generation == _generation:
+            return result
+    skin = getSkin(type, asset)
+    overrides = None
+    if asset and asset.skin:
+        overrides = dict((key, value) for key, value in asset.skin.iteritems() if key not in _ignoredOverrides)
+    key = (type, skin['name'] if skin else None, json.dumps(overrides, sort_keys=True) if overrides else None)
+    result = _styles.get(key)
+    if result is None or result.skin is not skin:
+        result = ResolvedStyle(type, skin, overrides)
+        _styles[key] = result
+    if asset:
+        asset.styles[type] = result
+    return result
 
 def metricToPixels(value):
     result = None
     if isinstance(value, basestring):
-        match = re.match(r"([0-9]+)([a-z]+)", value, re.I)
+        match = _metricPattern.match(value)
         if match:
             res = match.groups()
             return dpi2px(res[0], res[1])
@@ -62,15 +221,25 @@ def metricToPixels(value):
 
 def getControlSize(skin, asset):
     """get the size of control. The asset can overwrite it."""
+    if asset and asset.skin:
+        return _getControlSize(skin, asset.skin)
+    return _getControlSize(skin, None)
+
+def _getControlSize(skin, overrides):
     if skin:
-        if asset and asset.skin and "size" in asset.skin:
+        if overrides and "size" in overrides:
             width = metricToPixels(skin['size'][0])
             height = metricToPixels(skin['size'][1])
-            return (width * float(asset.skin["size"]), height * float(asset.skin["size"]))
-        return (skin["size"][0], skin["size"][1])
+            return (width * float(overrides["size"]), height * float(overrides["size"]))
+        return (_toPixels(skin["size"][0]), _toPixels(skin["size"][1]))
 
     return (100, 100)
 
+def _toPixels(value):
+    if isinstance(value, (int, float)):
+        return value
+    return metricToPixels(value)
+
 
 
 def getVar(skin, asset, name, default = None):
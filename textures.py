@@ -0,0 +1,128 @@
+__author__ = 'Jan Bogaerts'
+__copyright__ = "Copyright 2016, AllThingsTalk"
+__credits__ = []
+__maintainer__ = "Jan Bogaerts"
+__email__ = "jb@allthingstalk.com"
+__status__ = "Prototype"  # "Development", or "Production"
+
+# decodes the images of the skins on background threads, so that building a control doesn't have to read and decode
+# png files on the ui thread. Only the upload to the gpu (creating the texture) has to be done on the ui thread.
+# The textures end up in kivy's texture cache, so the Image widgets and button backgrounds that use the same file
+# don't go to disk anymore. Entries in that cache expire when they aren't used for a while, so they are put back
+# each time a control asks for its images. Widgets that can take a texture should use getTexture instead.
+
+import os
+import json
+import logging
+from kivy.clock import mainthread
+from kivy.cache import Cache
+from kivy.core.image import ImageLoader
+from kivy.resources import resource_find
+
+from workers import WorkerPool
+
+
+class TexturePreloader(object):
+    """keeps the decoded images in memory, so their textures can be handed out without loading them again."""
+
+    def __init__(self, workers = 2):
+        self._pool = WorkerPool(workers, 'texture')
+        self._loaded = {}                                           # file name -> image
+        self._pending = {}                                          # file name -> functions to call when it's loaded
+        self._files = {}                                            # source -> the files that have to be loaded for it
+        self._regions = {}                                          # atlas url -> (file name of the atlas page, coordinates in that page)
+        self._textures = {}                                         # source -> texture, for the sources that were asked with getTexture
+
+    def preload(self, sources, callback = None):
+        """
+        load the images in the background.
+        :param sources: list of image files or atlas urls
+        :param callback: function without params, called on the ui thread when all the images are loaded (also when
+                         some of them failed). Called right away if they were already loaded.
+        """
+        waiting = set()
+        for source in sources:
+            for fileName in self._getFiles(source):
+                if fileName in self._loaded:
+                    self._keepCached(fileName)                      # the control is about to be built, it shouldn't find an expired entry
+                else:
+                    waiting.add(fileName)
+        if not waiting:
+            if callback:
+                callback()
+            return
+        remaining = [len(waiting)]
+        def imageDone():
+            remaining[0] -= 1
+            if remaining[0] == 0 and callback:
+                callback()
+        for fileName in waiting:
+            if fileName in self._pending:
+                self._pending[fileName].append(imageDone)
+            else:
+                self._pending[fileName] = [imageDone]
+                self._pool.submit(ImageLoader.load, (fileName,), lambda image, fileName=fileName: self._decoded(fileName, image, None),
+                                  lambda e, fileName=fileName: self._decoded(fileName, None, e))
+
+    @mainthread
+    def _decoded(self, fileName, image, error):
+        """called on the ui thread when an image was decoded"""
+        if image:
+            try:
+                image.texture                                       # creates the texture and puts it in the texture cache, needs the ui thread.
+                self._loaded[fileName] = image
+            except:
+                logging.exception("failed to create texture for " + fileName)
+        else:
+            logging.error("failed to load image {}: {}".format(fileName, error))
+        for callback in self._pending.pop(fileName, []):
+            callback()
+
+    def getTexture(self, source):
+        """the texture of an image file or atlas url that was preloaded, None if it isn't loaded (yet).
+        Unlike a file name, the texture doesn't depend on the texture cache, so this never loads anything."""
+        result = self._textures.get(source)
+        if result is None:
+            files = self._getFiles(source)
+            if len(files) != 1 or files[0] not in self._loaded:     # an atlas url always refers to 1 page
+                return None
+            result = self._loaded[files[0]].texture
+            region = self._regions.get(source)
+            if region:
+                result = result.get_region(*region[1])
+            self._textures[source] = result
+        return result
+
+    def _keepCached(self, fileName):
+        """put the texture back in kivy's texture cache, with the same key that kivy uses, in case it expired."""
+        Cache.append('kv.texture', u'%s|%d|%d' % (fileName, 0, 0), self._loaded[fileName].texture)
+
+    def _getFiles(self, source):
+        """the files that have to be loaded for the source: for atlas urls, the images of the atlas"""
+        result = self._files.get(source)
+        if result is None:
+            if source.startswith('atlas://'):
+                atlasFile, id = source[8:].rsplit('/', 1)
+                atlasFile += '.atlas'
+                try:
+                    with open(atlasFile) as data_file:
+                        pages = json.load(data_file)
+                    result = []
+                    for page, ids in pages.iteritems():
+                        if id in ids:                                       # only the page that contains the image is needed
+                            fileName = resource_find(os.path.join(os.path.dirname(atlasFile), page))
+                            result.append(fileName)
+                            self._regions[source] = (fileName, ids[id])
+                    if not result:
+                        logging.error("{} not found in atlas {}".format(id, atlasFile))
+                except (IOError, ValueError):
+                    logging.exception("failed to read atlas " + atlasFile)
+                    result = []
+            else:
+                result = [resource_find(source)]                    # kivy uses the full path as key in the texture cache
+            result = [fileName for fileName in result if fileName]
+            self._files[source] = result
+        return result
+
+
+preloader = TexturePreloader()
@@ -0,0 +1,44 @@
+__author__ = 'Jan Bogaerts'
+__copyright__ = "Copyright 2016, AllThingsTalk"
+__credits__ = []
+__maintainer__ = "Jan Bogaerts"
+__email__ = "jb@allthingstalk.com"
+__status__ = "Prototype"  # "Development", or "Production"
+
+# moves values that arrive on the mqtt network thread to the ui thread.
+# kivy properties may only be changed from the ui thread, and redrawing a control for every sample of a chatty
+# sensor is a waste: we only keep the latest value per key and deliver them all together, once per frame.
+
+import logging
+import threading
+import collections
+from kivy.clock import Clock
+
+
+class UpdateQueue:
+    """collects values from any thread and delivers them on the ui thread at the next frame.
+    When multiple values arrive for the same key within 1 frame, only the last one is delivered."""
+
+    def __init__(self):
+        self._pending = collections.OrderedDict()                   # key -> (callback, value)
+        self._lock = threading.Lock()
+        self._trigger = Clock.create_trigger(self._flush)          # a trigger is only scheduled once per frame, no matter how many times it is called.
+
+    def post(self, key, callback, value):
+        """deliver value to callback(value) on the ui thread. Replaces any value that is still pending for the same key."""
+        with self._lock:
+            self._pending[key] = (callback, value)
+        self._trigger()
+
+    def _flush(self, dt):
+        with self._lock:
+            pending = self._pending
+            self._pending = collections.OrderedDict()
+        for callback, value in pending.itervalues():
+            try:
+                callback(value)
+            except:
+                logging.exception("failed to process value update")
+
+
+updates = UpdateQueue()
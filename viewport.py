@@ -0,0 +1,64 @@
+__author__ = 'Jan Bogaerts'
+__copyright__ = "Copyright 2016, AllThingsTalk"
+__credits__ = []
+__maintainer__ = "Jan Bogaerts"
+__email__ = "jb@allthingstalk.com"
+__status__ = "Prototype"  # "Development", or "Production"
+
+# only the asset widgets that are on (or near) the screen get a real control. The others show a light placeholder of
+# the same size, so that the flow layout of the workspace doesn't change while scrolling.
+# kivy 1.9.1 doesn't have a RecycleView, and the sections are laid out by a StackLayout that needs the size of every
+# item, so the section and asset widgets themselves are kept, it's the controls that get created and freed on demand.
+
+from kivy.clock import Clock
+
+from layoutwidgets import AssetWidget, SectionWidget
+
+
+class ViewportTracker(object):
+    """
+    watches the scroll position of the workspace and builds the controls of the asset widgets that scroll into view.
+    Controls that are far out of view are released again.
+    """
+
+    def __init__(self, scrollView, workspace, load, margin = 1.0):
+        """
+        :param scrollView: the ScrollView that contains the workspace
+        :param workspace: the layout that contains the section widgets
+        :param load: function(assetWidget, sectionWidget), called for asset widgets that became visible but whose asset isn't loaded yet.
+        :param margin: how far (in screen heights) outside of the visible area controls are already built. Controls are
+                       released when they are further away than twice the margin, so scrolling back and forth doesn't rebuild them.
+        """
+        self.scrollView = scrollView
+        self.workspace = workspace
+        self.load = load
+        self.margin = margin
+        self._trigger = Clock.create_trigger(self.update)
+        scrollView.bind(scroll_y=self._trigger, size=self._trigger)
+        workspace.bind(size=self._trigger)                          # sections got added or controls changed size
+
+    def refresh(self):
+        """check what's visible at the next frame (after the layouts have positioned the new widgets)"""
+        self._trigger()
+
+    def update(self, *args):
+        bottom = self.scrollView.to_window(self.scrollView.x, self.scrollView.y)[1]
+        height = self.scrollView.height
+        top = bottom + height
+        margin = height * self.margin
+        for sectionW in self.workspace.children:
+            if not isinstance(sectionW, SectionWidget):                 # the 'add' button in edit mode
+                continue
+            for assetW in sectionW.assets.children:
+                if not isinstance(assetW, AssetWidget):
+                    continue
+                y = assetW.to_window(assetW.x, assetW.y)[1]
+                if y < top + margin and y + assetW.height > bottom - margin:
+                    if not assetW.isMaterialized:
+                        if assetW.data.isLoaded:
+                            assetW.showControl()
+                        elif not assetW.isLoading:
+                            assetW.isLoading = True
+                            self.load(assetW, sectionW)
+                elif y > top + 2 * margin or y + assetW.height < bottom - 2 * margin:
+                    assetW.releaseControl()
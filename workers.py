@@ -0,0 +1,65 @@
+__author__ = 'Jan Bogaerts'
+__copyright__ = "Copyright 2016, AllThingsTalk"
+__credits__ = []
+__maintainer__ = "Jan Bogaerts"
+__email__ = "jb@allthingstalk.com"
+__status__ = "Prototype"  # "Development", or "Production"
+
+# background threads for doing network work without blocking the ui or the mqtt network thread.
+# this module doesn't depend on kivy: callbacks are called on the worker thread, it's up to the caller to
+# move the result to the ui thread (use kivy.clock.mainthread for that).
+
+import logging
+import threading
+import Queue
+
+
+class WorkerPool:
+    """a bounded set of daemon threads that process jobs from a shared queue.
+    The threads are only started when the first job is submitted."""
+
+    def __init__(self, size = 4, name = 'worker'):
+        self.size = size
+        self.name = name
+        self._jobs = Queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def submit(self, func, args = (), callback = None, errback = None):
+        """
+        run func(*args) on one of the worker threads.
+        :param callback: called with the result of func when it completed succesfully.
+        :param errback: called with the exception when func failed. If there is no errback, the error is logged.
+        """
+        self._startThreads()
+        self._jobs.put((func, args, callback, errback))
+
+    def _startThreads(self):
+        with self._lock:
+            while len(self._threads) < self.size:
+                thread = threading.Thread(target=self._run, name=self.name + '-' + str(len(self._threads)))
+                thread.daemon = True                                # don't keep the app alive when it closes.
+                self._threads.append(thread)
+                thread.start()
+
+    def _run(self):
+        while True:
+            func, args, callback, errback = self._jobs.get()
+            try:
+                result = func(*args)
+            except Exception as e:
+                if errback:
+                    self._safeCall(errback, e)
+                else:
+                    logging.exception("background job failed")
+            else:
+                if callback:
+                    self._safeCall(callback, result)
+            finally:
+                self._jobs.task_done()
+
+    def _safeCall(self, func, arg):
+        try:
+            func(arg)
+        except:
+            logging.exception("callback of background job failed")